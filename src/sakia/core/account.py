@@ -591,6 +591,6 @@ class Account(QObject):
                 'pubkey': self.pubkey,
                 'communities': data_communities,
                 'wallets': data_wallets,
-                'contacts': self.contacts,
+                'contacts': [dict(c) for c in self.contacts],
                 'file_version': __version__}
         return data
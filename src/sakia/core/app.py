@@ -19,6 +19,10 @@ from ucoinpy.api.bma import API
 from aiohttp.connector import ProxyConnector
 from . import config
 from .account import Account
+from .net.api.bma.store import BmaStore
+from .persistence import Persistence
+from .scanner import BlockScanner
+from .blockstore import BlockStore
 from .registry import IdentitiesRegistry, Identity
 from .. import __version__
 from ..tools.exceptions import NameAlreadyExists, BadAccountFile
@@ -59,6 +63,8 @@ class Application(QObject):
                                   "")
         self._translator = QTranslator(self.qapp)
         self._identities_registry = identities_registry
+        self._persistence = Persistence(loop)
+        self._block_scanners = {}
         self.preferences = {'account': "",
                             'lang': 'en_GB',
                             'ref': 0,
@@ -161,6 +167,22 @@ class Application(QObject):
     def identities_registry(self):
         return self._identities_registry
 
+    def block_scanner(self, community):
+        """
+        Get the block scanner shared by the wallets of all the accounts
+        in the currency of a community, with its local block store
+
+        :param sakia.core.Community community: The community
+        :rtype: sakia.core.scanner.BlockScanner
+        """
+        if community.currency not in self._block_scanners:
+            blocks_path = os.path.join(config.parameters['home'], '__blocks__')
+            if not os.path.exists(blocks_path):
+                os.makedirs(blocks_path)
+            store = BlockStore(os.path.join(blocks_path, community.currency + '.sqlite'))
+            self._block_scanners[community.currency] = BlockScanner(store)
+        return self._block_scanners[community.currency]
+
     def add_account(self, account):
         self.accounts[account.name] = account
 
@@ -174,8 +196,7 @@ class Application(QObject):
         self.accounts.pop(account.name)
         if self._current_account == account:
             self._current_account = None
-        with open(config.parameters['data'], 'w') as outfile:
-            json.dump(self.jsonify(), outfile, indent=4, sort_keys=True)
+        self._persistence.mark_dirty(config.parameters['data'], self.jsonify, indent=4)
         if self.preferences['account'] == account.name:
             self.preferences['account'] = ""
             self.save_preferences(self.preferences)
@@ -202,7 +223,7 @@ class Application(QObject):
         Save the account to the cache
         and stop the coroutines
         """
-        self.save_cache(self._current_account)
+        await self.save_cache(self._current_account)
         self.save_notifications(self._current_account)
         await self._current_account.stop_coroutines()
 
@@ -255,11 +276,19 @@ class Application(QObject):
 
             for community in account.communities:
                 community.network.blockchain_rollback.connect(community.rollback_cache)
+                community.network.new_block_mined.connect(lambda b, co=community:
+                                                          asyncio.ensure_future(self.refresh_members(co, b)))
                 community.network.new_block_mined.connect(lambda b, co=community:
                                                           account.refresh_transactions(self, co))
                 community.network.blockchain_rollback.connect(lambda b, co=community:
                                                               account.rollback_transaction(self, co))
                 community.network.root_nodes_changed.connect(lambda acc=account: self.save(acc))
+                community.network.nodes_changed.connect(lambda acc=account, co=community:
+                                                        self.save_network(acc, co))
+
+            for wallet in account.wallets:
+                wallet.refresh_finished.connect(lambda received, acc=account, w=wallet:
+                                                self.save_wallet(acc, w))
 
         account_notifications_path = os.path.join(config.parameters['home'],
                                     account_name, '__notifications__')
@@ -278,8 +307,16 @@ class Application(QObject):
 
         :param account: The account object to load the cache
         """
+        if not os.path.exists(os.path.join(config.parameters['home'],
+                                        account.name, '__cache__')):
+            os.makedirs(os.path.join(config.parameters['home'],
+                                        account.name, '__cache__'))
         for community in account.communities:
             bma_path = os.path.join(config.parameters['home'],
+                                        account.name, '__cache__',
+                                        community.currency + '_bma.sqlite')
+            # The cache saved as json by previous versions
+            legacy_bma_path = os.path.join(config.parameters['home'],
                                         account.name, '__cache__',
                                         community.currency + '_bma')
 
@@ -292,10 +329,15 @@ class Application(QObject):
                     data = json.load(json_data)
                     community.network.merge_with_json(data['network'], parse_version(data['version']))
 
-            if os.path.exists(bma_path):
-                with open(bma_path, 'r') as json_data:
+            if os.path.exists(legacy_bma_path):
+                with open(legacy_bma_path, 'r') as json_data:
                     data = json.load(json_data)
                     community.bma_access.load_from_json(data['cache'])
+            community.bma_access.attach_store(BmaStore(bma_path))
+            if os.path.exists(legacy_bma_path):
+                logging.debug("Migrating {0} to {1}".format(legacy_bma_path, bma_path))
+                community.bma_access.flush()
+                os.remove(legacy_bma_path)
 
         for wallet in account.wallets:
             for c in account.communities:
@@ -345,8 +387,7 @@ class Application(QObject):
 
         :param account: The account object to save
         """
-        with open(config.parameters['data'], 'w') as outfile:
-            json.dump(self.jsonify(), outfile, indent=4, sort_keys=True)
+        self._persistence.mark_dirty(config.parameters['data'], self.jsonify, indent=4)
         account_path = os.path.join(config.parameters['home'],
                                 account.name)
         if account.name in self.accounts:
@@ -354,10 +395,10 @@ class Application(QObject):
             if not os.path.exists(account_path):
                 logging.info("Creating account directory")
                 os.makedirs(account_path)
-            with open(properties_path, 'w') as outfile:
-                json.dump(account.jsonify(), outfile, indent=4, sort_keys=True)
+            self._persistence.mark_dirty(properties_path, account.jsonify, indent=4)
         else:
             account_path = os.path.join(config.parameters['home'], account.name)
+            self._persistence.discard(account_path)
             shutil.rmtree(account_path)
 
     def save_notifications(self, account):
@@ -369,8 +410,22 @@ class Application(QObject):
         account_path = os.path.join(config.parameters['home'],
                                 account.name)
         notifications_path = os.path.join(account_path, '__notifications__')
-        with open(notifications_path, 'w') as outfile:
-            json.dump(account.notifications, outfile, indent=4, sort_keys=True)
+
+        def jsonify():
+            # The notifications are modified in place
+            return dict((k, list(v) if isinstance(v, list) else v) for k, v in account.notifications.items())
+
+        self._persistence.mark_dirty(notifications_path, jsonify, indent=4)
+
+    async def refresh_members(self, community, block_number):
+        """
+        Refresh the identities of the members of a community
+
+        :param sakia.core.Community community: The community
+        :param int block_number: The number of the new block
+        """
+        if await self._identities_registry.refresh_members(community, block_number):
+            self.save_registries()
 
     def save_registries(self):
         """
@@ -378,13 +433,13 @@ class Application(QObject):
         """
         identities_path = os.path.join(config.parameters['home'],
                                     '__identities__')
-        buffer_path = identities_path + ".buf"
-        with open(buffer_path, 'w') as outfile:
+
+        def jsonify():
             data = self.identities_registry.jsonify()
             data['version'] = __version__
-            for chunk in json.JSONEncoder().iterencode(data):
-                outfile.write(chunk)
-        shutil.move(buffer_path, identities_path)
+            return data
+
+        self._persistence.mark_dirty(identities_path, jsonify)
 
     def save_wallet(self, account, wallet):
         """
@@ -399,15 +454,38 @@ class Application(QObject):
                                      account.name, '__cache__'))
         wallet_path = os.path.join(config.parameters['home'],
                                    account.name, '__cache__', wallet.pubkey + "_wal")
-        buffer_path = wallet_path + ".buf"
-        with open(buffer_path, 'w') as outfile:
+
+        def jsonify():
             data = wallet.jsonify_caches()
             data['version'] = __version__
-            for chunk in json.JSONEncoder().iterencode(data):
-                outfile.write(chunk)
-        shutil.move(buffer_path, wallet_path)
+            return data
 
-    def save_cache(self, account):
+        self._persistence.mark_dirty(wallet_path, jsonify)
+
+    def save_network(self, account, community):
+        """
+        Save the network of a community in cache
+
+        :param sakia.core.account.Account account: Account instance
+        :param sakia.core.Community community: Community instance
+        """
+        if not os.path.exists(os.path.join(config.parameters['home'],
+                                           account.name, '__cache__')):
+            os.makedirs(os.path.join(config.parameters['home'],
+                                     account.name, '__cache__'))
+        network_path = os.path.join(config.parameters['home'],
+                                    account.name, '__cache__',
+                                    community.currency + '_network')
+
+        def jsonify():
+            data = dict()
+            data['network'] = community.network.jsonify()
+            data['version'] = __version__
+            return data
+
+        self._persistence.mark_dirty(network_path, jsonify)
+
+    async def save_cache(self, account):
         """
         Save the cache of an account
 
@@ -423,29 +501,12 @@ class Application(QObject):
         for community in account.communities:
             bma_path = os.path.join(config.parameters['home'],
                                         account.name, '__cache__',
-                                        community.currency + '_bma')
-
-            network_path = os.path.join(config.parameters['home'],
-                                        account.name, '__cache__',
-                                        community.currency + '_network')
-            buffer_path = network_path + ".buf"
-
-            with open(buffer_path, 'w') as outfile:
-                data = dict()
-                data['network'] = community.network.jsonify()
-                data['version'] = __version__
-                for chunk in json.JSONEncoder().iterencode(data):
-                    outfile.write(chunk)
-            shutil.move(buffer_path, network_path)
-
-            buffer_path = bma_path + ".buf"
+                                        community.currency + '_bma.sqlite')
+            self.save_network(account, community)
 
-            with open(buffer_path, 'w') as outfile:
-                data['cache'] = community.bma_access.jsonify()
-                data['version'] = __version__
-                for chunk in json.JSONEncoder().iterencode(data):
-                    outfile.write(chunk)
-            shutil.move(buffer_path, bma_path)
+            if community.bma_access.store is None:
+                community.bma_access.attach_store(BmaStore(bma_path))
+            await community.bma_access.save()
 
     def import_account(self, file, name):
         """
@@ -474,13 +535,15 @@ class Application(QObject):
         self.save(account)
         self.account_imported.emit(account.name)
 
-    def export_account(self, file, account):
+    async def export_account(self, file, account):
         """
-        Export an account to a tar file
+        Export an account to a tar file.
+        The pending writes are flushed first, so that the exported files are up to date.
 
         :param str file: The filepath of the tar file
         :param account: The account object to export
         """
+        await self._persistence.flush()
         with tarfile.open(file, "w") as tar:
             for file in ["properties"]:
                 path = os.path.join(config.parameters['home'],
@@ -513,6 +576,13 @@ class Application(QObject):
             await self.stop_current_account()
         await asyncio.sleep(0)
         self.save_registries()
+        for account in self.accounts.values():
+            if account:
+                for community in account.communities:
+                    community.bma_access.close()
+        for scanner in self._block_scanners.values():
+            scanner.close()
+        await self._persistence.flush()
 
     @asyncify
     async def get_last_version(self):
@@ -0,0 +1,161 @@
+import logging
+import sqlite3
+
+
+class BlockStore:
+    """
+    The local store of the blocks of a currency, in a sqlite database.
+    Only blocks which can not be rolled back anymore are stored.
+    Headers are indexed by number, hash and dividend presence,
+    blocks by the public keys of the issuers and recipients of their transactions.
+    The added blocks are written to the database file by commit.
+    """
+    def __init__(self, path):
+        """
+        :param str path: The path of the database file
+        """
+        self._path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS blocks (
+                                    number INTEGER PRIMARY KEY,
+                                    hash TEXT NOT NULL,
+                                    currency TEXT NOT NULL,
+                                    mediantime INTEGER NOT NULL,
+                                    members_count INTEGER NOT NULL,
+                                    dividend INTEGER,
+                                    signed_raw TEXT NOT NULL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS blocks_hash ON blocks (hash)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS blocks_dividend ON blocks (dividend) "
+                               "WHERE dividend IS NOT NULL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS blocks_pubkeys (
+                                    pubkey TEXT NOT NULL,
+                                    block_number INTEGER NOT NULL,
+                                    PRIMARY KEY (pubkey, block_number))""")
+
+    @property
+    def path(self):
+        return self._path
+
+    def __contains__(self, number):
+        return self._conn.execute("SELECT 1 FROM blocks WHERE number=?", (number,)).fetchone() is not None
+
+    def add(self, block_hash, signed_raw, block_doc):
+        """
+        Store a block which can not be rolled back anymore.
+        The block is read back before the next commit, but it is only written
+        to the database file by the commit.
+
+        :param str block_hash: The hash of the block
+        :param str signed_raw: The signed raw document of the block
+        :param ucoinpy.documents.Block block_doc: The parsed document of the block
+        """
+        self._conn.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           (block_doc.number, block_hash, block_doc.currency, block_doc.mediantime,
+                            block_doc.members_count, block_doc.ud, signed_raw))
+        self._conn.execute("DELETE FROM blocks_pubkeys WHERE block_number=?", (block_doc.number,))
+        pubkeys = set()
+        for tx in block_doc.transactions:
+            pubkeys |= set(tx.issuers) | set(o.pubkey for o in tx.outputs)
+        self._conn.executemany("INSERT INTO blocks_pubkeys VALUES (?, ?)",
+                               ((pubkey, block_doc.number) for pubkey in pubkeys))
+        logging.debug("Stored block {0}".format(block_doc.number))
+
+    def commit(self):
+        """
+        Write the blocks added since the previous commit, in a single transaction
+        """
+        self._conn.commit()
+
+    def block(self, number):
+        """
+        Get a stored block
+
+        :param int number: The block number
+        :return: The hash and the signed raw document of the block, or None if it is not stored
+        :rtype: tuple[str, str]
+        """
+        return self._conn.execute("SELECT hash, signed_raw FROM blocks WHERE number=?", (number,)).fetchone()
+
+    def header(self, number):
+        """
+        Get the header of a stored block
+
+        :param int number: The block number
+        :return: The header, with the keys of a bma block, or None if the block is not stored
+        :rtype: dict
+        """
+        row = self._conn.execute("""SELECT number, hash, mediantime, members_count, dividend
+                                    FROM blocks WHERE number=?""", (number,)).fetchone()
+        if row:
+            return {'number': row[0],
+                    'hash': row[1],
+                    'medianTime': row[2],
+                    'membersCount': row[3],
+                    'dividend': row[4]}
+        return None
+
+    def median_time(self, number):
+        """
+        Get the median time of a stored block
+
+        :param int number: The block number
+        :return: The median time, or None if the block is not stored
+        :rtype: int
+        """
+        row = self._conn.execute("SELECT mediantime FROM blocks WHERE number=?", (number,)).fetchone()
+        return row[0] if row else None
+
+    def number(self, block_hash):
+        """
+        Get the number of a stored block from its hash
+
+        :param str block_hash: The hash of the block
+        :return: The block number, or None if the block is not stored
+        :rtype: int
+        """
+        row = self._conn.execute("SELECT number FROM blocks WHERE hash=?", (block_hash,)).fetchone()
+        return row[0] if row else None
+
+    def dividends_blocks(self, from_number, to_number):
+        """
+        Get the numbers of the stored blocks with a dividend in a range
+
+        :param int from_number: The number of the first block
+        :param int to_number: The number of the last block
+        :rtype: list[int]
+        """
+        return [r[0] for r in self._conn.execute("""SELECT number FROM blocks
+                                                    WHERE dividend IS NOT NULL AND number >= ? AND number <= ?
+                                                    ORDER BY number""", (from_number, to_number))]
+
+    def numbers(self, from_number, to_number):
+        """
+        Get the numbers of the stored blocks in a range
+
+        :param int from_number: The number of the first block
+        :param int to_number: The number of the last block
+        :rtype: list[int]
+        """
+        return [r[0] for r in self._conn.execute("""SELECT number FROM blocks
+                                                    WHERE number >= ? AND number <= ?
+                                                    ORDER BY number""", (from_number, to_number))]
+
+    def transactions_blocks(self, pubkey, from_number, to_number):
+        """
+        Get the numbers of the stored blocks with transactions issued by or sent to a public key
+
+        :param str pubkey: The public key
+        :param int from_number: The number of the first block
+        :param int to_number: The number of the last block
+        :rtype: list[int]
+        """
+        return [r[0] for r in self._conn.execute("""SELECT block_number FROM blocks_pubkeys
+                                                    WHERE pubkey = ? AND block_number >= ? AND block_number <= ?
+                                                    ORDER BY block_number""", (pubkey, from_number, to_number))]
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
@@ -14,9 +14,10 @@ import math
 from PyQt5.QtCore import QObject, pyqtSignal
 
 from ..tools.exceptions import NoPeerAvailable
+from ..tools.documents import parse_block
 from .net.network import Network
 from ucoinpy.api import bma
-from ucoinpy.documents import Block, BlockId
+from ucoinpy.documents import BlockId
 from .net.api.bma.access import BmaAccess
 
 
@@ -42,6 +43,7 @@ class Community(QObject):
         self.currency = currency
         self._network = network
         self._bma_access = bma_access
+        self._network.new_block_mined.connect(self.inject_current_block)
 
     @classmethod
     def create(cls, node):
@@ -314,7 +316,7 @@ class Community(QObject):
             if '404' in str(e):
                 return BlockId.empty()
 
-        return Block.from_signed_raw(signed_raw).blockid
+        return parse_block(signed_raw).blockid
 
     async def members_pubkeys(self):
         """
@@ -325,6 +327,16 @@ class Community(QObject):
         memberships = await self.bma_access.future_request(bma.wot.Members)
         return [m['pubkey'] for m in memberships["results"]]
 
+    def inject_current_block(self, block_number):
+        """
+        Put the new current block pushed by the nodes in the cache
+
+        :param int block_number: The number of the new block
+        """
+        block_data = self.network.current_block
+        if block_data and block_data['number'] == block_number:
+            self._bma_access.inject_block(block_data)
+
     def start_coroutines(self):
         self.network.start_coroutines()
 
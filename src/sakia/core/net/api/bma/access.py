@@ -2,14 +2,19 @@ from PyQt5.QtCore import QObject, pyqtSlot
 from ucoinpy.api import bma
 from .....tools.exceptions import NoPeerAvailable
 from ..... import __version__
+from .cache import BmaCache, CacheKey
 import logging
 from aiohttp.errors import ClientError, ServerDisconnectedError
 import asyncio
 import random
+import sqlite3
 from socket import gaierror
 import jsonschema
 from pkg_resources import parse_version
 
+EXPLORATION_RATIO = 0.1
+SCORE_TOLERANCE = 1.5
+
 
 class BmaAccess(QObject):
     """
@@ -17,19 +22,20 @@ class BmaAccess(QObject):
     """
 
     __saved_requests = [str(bma.blockchain.Block), str(bma.blockchain.Parameters)]
+    __pinned_requests = [str(bma.blockchain.Parameters), str(bma.blockchain.UD)]
 
     def __init__(self, data, network):
         """
         Constructor of a network
 
-        :param dict data: The data present in this cache
+        :param sakia.core.net.api.bma.cache.BmaCache data: The data present in this cache
         :param sakia.core.net.network.Network network: The network used to connect
         """
         super().__init__()
         self._data = data
-        self._rollback_to = None
         self._pending_requests = {}
         self._network = network
+        self._save_lock = asyncio.Lock()
 
     @classmethod
     def create(cls, network):
@@ -40,11 +46,11 @@ class BmaAccess(QObject):
         :return: A new BmaAccess object
         :rtype: sakia.core.net.api.bma.access.BmaAccess
         """
-        return cls({}, network)
+        return cls(BmaCache(), network)
 
     @property
     def data(self):
-        return self._data.copy()
+        return dict(self._data.items())
 
     def load_from_json(self, json_data):
         """
@@ -52,13 +58,16 @@ class BmaAccess(QObject):
 
         :param dict data: The cache in json format
         """
-        data = {}
+        data = BmaCache()
         for entry in json_data['entries']:
-            key = entry['key']
-            cache_key = (key[0], key[1], key[2], key[3], key[4])
-            data[cache_key] = entry['value']
+            cache_key = CacheKey.from_json(entry['key'])
+            if cache_key:
+                data.put(cache_key, entry['value'],
+                         pinned=BmaAccess._pinned(cache_key.request, entry['value']['value']),
+                         permanent=entry['value']['metadata'].get('permanent', False))
+        if json_data['rollback'] is not None:
+            data.unconfirm_blocks(json_data['rollback'])
         self._data = data
-        self._rollback_to = json_data['rollback']
 
     def jsonify(self):
         """
@@ -66,44 +75,85 @@ class BmaAccess(QObject):
 
         :return: The cache as a dict in json format
         """
-        data = {k: self._data[k] for k in self._data.keys()}
         entries = []
-        for d in data:
-            entries.append({'key': d,
-                            'value': data[d]})
-        return {'rollback': self._rollback_to,
+        for key, entry in self._data.items():
+            entries.append({'key': key.jsonify(),
+                            'value': entry})
+        return {'rollback': self._data.unconfirmed_from,
                 'entries': entries}
 
+    @property
+    def store(self):
+        return self._data.store
+
+    def attach_store(self, store):
+        """
+        Persist the cache in a store.
+        The cache must be loaded from json before being attached.
+
+        :param sakia.core.net.api.bma.store.BmaStore store: The store
+        """
+        self._data.attach(store)
+
+    def flush(self):
+        """
+        Write the changes of the cache to its store
+        """
+        self._data.flush()
+
+    async def save(self):
+        """
+        Write the changes of the cache to its store, out of the event loop.
+        The changes are written in order, one save at a time.
+        """
+        with (await self._save_lock):
+            changes = self._data.begin_flush()
+            if changes is None:
+                return
+            store = self._data.store
+            try:
+                await asyncio.get_event_loop().run_in_executor(None, store.save, *changes)
+                self._data.end_flush(changes)
+            except sqlite3.Error as e:
+                logging.error("Could not save the cache : {0}".format(str(e)))
+                self._data.end_flush(changes, written=False)
+
+    def close(self):
+        """
+        Flush the cache and close its store
+        """
+        self._data.close()
+
     @staticmethod
-    def _gen_cache_key(request, req_args, get_args):
-        return (str(request),
-                str(tuple(frozenset(sorted(req_args.keys())))),
-                str(tuple(frozenset(sorted(req_args.values())))),
-                str(tuple(frozenset(sorted(get_args.keys())))),
-                str(tuple(frozenset(sorted(get_args.values())))))
-
-    def _compare_json(self, first, second):
-        """
-        Compare two json dicts
-        :param first: the first dictionnary
-        :param second: the second dictionnary
-        :return: True if the json dicts are the same
+    def _pinned(request, data):
+        """
+        Check if cached data must never be evicted from the cache.
+        Parameters and universal dividends blocks are cheap to keep
+        but are requested everywhere.
+
+        :param str request: The request type
+        :param dict data: The cached json data
+        :return: True if the data must stay in cache
         :rtype: bool
         """
-        def ordered(obj):
-            if isinstance(obj, dict):
-                try:
-                    return sorted((k, ordered(v)) for k, v in obj.items())
-                except TypeError:
-                    return obj
-            if isinstance(obj, list):
-                try:
-                    return sorted(ordered(x) for x in obj)
-                except TypeError:
-                    return obj
-            else:
-                return obj
-        return ordered(first) == ordered(second)
+        if request in BmaAccess.__pinned_requests:
+            return True
+        return request == str(bma.blockchain.Block) and data.get('dividend') is not None
+
+    def _immutable(self, cache_key):
+        """
+        Check if the data of a request can not change anymore.
+        Blocks older than the fork window can't be rolled back.
+
+        :param CacheKey cache_key: The cache key of the request
+        :return: True if the data can not change
+        :rtype: bool
+        """
+        if cache_key.request == str(bma.blockchain.Block):
+            number = cache_key.arg('number')
+            return number is not None \
+                and number <= self._network.current_blockid.number - self._network.fork_window
+        return False
 
     def _get_from_cache(self, request, req_args, get_args):
         """
@@ -112,18 +162,20 @@ class BmaAccess(QObject):
         :param cache_key: The key
         :rtype: tuple[bool, dict]
         """
-        cache_key = BmaAccess._gen_cache_key(request, req_args, get_args)
-        if cache_key in self._data.keys():
-            cached_data = self._data[cache_key]
+        cache_key = CacheKey.from_request(request, req_args, get_args)
+        cached_data = self._data.get(cache_key)
+        if cached_data:
             need_reload = True
+            if self._data.is_permanent(cache_key):
+                need_reload = False
             # If we detected a rollback
-            # We reload if we don't know if this block changed or not
-            if self._rollback_to:
-                if request is bma.blockchain.Block:
-                    if get_args["number"] >= self._rollback_to:
-                        need_reload = True
-                if request is bma.blockchain.Parameters and self._rollback_to == 0:
-                    need_reload = True
+            # We reload if we don't know if this block changed or not,
+            # before it can be promoted to the permanent tier
+            elif not self._data.confirmed(cache_key):
+                need_reload = True
+            elif self._immutable(cache_key):
+                self._data.promote(cache_key)
+                need_reload = False
             elif str(request) in BmaAccess.__saved_requests \
                 or cached_data['metadata']['block_hash'] == self._network.current_blockid.sha_hash:
                 need_reload = False
@@ -139,17 +191,19 @@ class BmaAccess(QObject):
 
         If the request is a bma/blockchain/Block, we check if
         the hash answered is the same as our hash, in which case,
-        we know that the rollback didn't reset blocks before this one
+        we know that the rollback didn't reset this block and the blocks before it.
+        A block with a different hash is replaced in the cache, which confirms it.
         :param class request: A bma request class calling for data
         :param dict req_args: Arguments to pass to the request constructor
         :param dict get_args: Arguments to pass to the request __get__ method
         :param dict data: Json data got from the blockchain
         """
-        if self._rollback_to and request is bma.blockchain.Block:
-            if get_args['number'] >= self._rollback_to:
-                cache_key = BmaAccess._gen_cache_key(request, req_args, get_args)
-                if cache_key in self._data and self._data[cache_key]['value']['hash'] == data['hash']:
-                    self._rollback_to = get_args['number']
+        if request is bma.blockchain.Block:
+            cache_key = CacheKey.from_request(request, req_args, get_args)
+            if not self._data.confirmed(cache_key):
+                cached_data = self._data.get(cache_key)
+                if cached_data and cached_data['value']['hash'] == data['hash']:
+                    self._data.confirm_blocks(cache_key.arg('number'))
 
     def _update_cache(self, request, req_args, get_args, data):
         """
@@ -163,18 +217,61 @@ class BmaAccess(QObject):
         """
         self._update_rollback(request, req_args, get_args, data)
 
-        cache_key = BmaAccess._gen_cache_key(request, req_args, get_args)
-        if cache_key not in self._data:
-            self._data[cache_key] = {'metadata': {},
-                                     'value': {}}
+        cache_key = CacheKey.from_request(request, req_args, get_args)
+        metadata = {'block_number': self._network.current_blockid.number,
+                    'block_hash': self._network.current_blockid.sha_hash,
+                    'sakia_version': __version__}
+        # A block replacing a block which could have been rolled back is only
+        # promoted once it is confirmed, the next time it is read
+        return self._data.update(cache_key, data, metadata,
+                                 pinned=BmaAccess._pinned(cache_key.request, data),
+                                 permanent=self._immutable(cache_key) and self._data.confirmed(cache_key))
+
+    def _append_block_number(self, request, block_data, contained):
+        """
+        Update a cached list of the blocks containing some data with a new block.
+        The list is only updated if it was up to date at the previous block,
+        otherwise it is requested again when it is needed.
+
+        :param class request: The bma request of the list, like bma.blockchain.TX
+        :param dict block_data: The json data of the new block
+        :param bool contained: True if the new block contains the data
+        """
+        cache_key = CacheKey.from_request(request, {}, {})
+        cached_data = self._data.get(cache_key)
+        if cached_data and cached_data['metadata']['block_hash'] == block_data.get('previousHash'):
+            blocks = cached_data['value']['result']['blocks']
+            if contained and block_data['number'] not in blocks:
+                blocks = blocks + [block_data['number']]
+            data = dict(cached_data['value'])
+            data['result'] = {'blocks': blocks}
+            self._update_cache(request, {}, {}, data)
+
+    def inject_block(self, block_data):
+        """
+        Put a new block pushed by the nodes in the cache, as the current block,
+        and add it to the cached lists of the blocks with transactions and dividends,
+        so that handling a new block does not request it again.
 
-        self._data[cache_key]['metadata']['block_number'] = self._network.current_blockid.number
-        self._data[cache_key]['metadata']['block_hash'] = self._network.current_blockid.sha_hash
-        self._data[cache_key]['metadata']['sakia_version'] = __version__
-        if not self._compare_json(self._data[cache_key]['value'], data):
-            self._data[cache_key]['value'] = data
-            return True
-        return False
+        :param dict block_data: The json data of the block
+        """
+        self._update_cache(bma.blockchain.Block, {'number': block_data['number']}, {}, block_data)
+        self._update_cache(bma.blockchain.Current, {}, {}, block_data)
+        self._append_block_number(bma.blockchain.TX, block_data, len(block_data['transactions']) > 0)
+        self._append_block_number(bma.blockchain.UD, block_data, block_data['dividend'] is not None)
+
+    def digest(self, request, req_args={}, get_args={}):
+        """
+        Get the digest of cached data.
+        Two requests replies are equal if their digests are equal.
+
+        :param class request: A bma request class calling for data
+        :param dict req_args: Arguments to pass to the request constructor
+        :param dict get_args: Arguments to pass to the request __get__ method
+        :return: The digest, or None if the data is not cached
+        :rtype: str
+        """
+        return self._data.digest(CacheKey.from_request(request, req_args, get_args))
 
     def _invalidate_cache(self, post_request):
         """
@@ -183,17 +280,15 @@ class BmaAccess(QObject):
         """
         invalidated = {bma.wot.Add: bma.wot.Lookup}
         if post_request in invalidated:
-            invalidated_cache = self._data.copy()
-            for data in self._data:
-                if data[0] == str(invalidated[post_request]):
-                    invalidated_cache.pop(data)
-            self._data = invalidated_cache
+            self._data.pop_request(str(invalidated[post_request]))
 
     def rollback(self):
         """
-        When a rollback is detected, we move the rollback cursor to 0
+        When a rollback is detected, the cached blocks which could have been rolled back
+        are marked to be reloaded. Blocks in the permanent tier of the cache
+        are older than the fork window, and are not reloaded.
         """
-        self._rollback_to = 0
+        self._data.unconfirm_blocks(max(0, self._network.current_blockid.number - self._network.fork_window))
 
     def filter_nodes(self, request, nodes):
         def compare_versions(node, version):
@@ -214,9 +309,76 @@ class BmaAccess(QObject):
         else:
             return nodes
 
+    def _pick_node(self, nodes):
+        """
+        Pick a node to send a request to.
+        Most of the requests go to the best scoring nodes,
+        a small share of them is sent to random nodes to refresh their scores.
+
+        :param list[sakia.core.net.Node] nodes: The nodes to choose from
+        :return: The node to request
+        :rtype: sakia.core.net.Node
+        """
+        if random.random() < EXPLORATION_RATIO:
+            return random.choice(nodes)
+        best_score = min(n.score for n in nodes)
+        best_nodes = [n for n in nodes if n.score <= best_score * SCORE_TOLERANCE]
+        return random.choice(best_nodes)
+
+    async def _request_nodes(self, request, req_args, get_args, nodes, cached=True):
+        """
+        Request the nodes until one of them answers, and cache the answer.
+
+        :param class request: A bma request class calling for data
+        :param dict req_args: Arguments to pass to the request constructor
+        :param dict get_args: Arguments to pass to the request __get__ method
+        :param list[sakia.core.net.Node] nodes: The nodes which can be requested
+        :param bool cached: False if the answer must not be cached
+        :return: The data, or None if no node answered
+        :rtype: dict
+        """
+        tries = 0
+        while tries < 3:
+            node = self._pick_node(nodes)
+            req = node.bma_request(request, **req_args)
+            try:
+                json_data = await node.timed_get(req, **get_args)
+                if cached:
+                    self._update_cache(request, req_args, get_args, json_data)
+                return json_data
+            except ValueError as e:
+                if '404' in str(e) or '400' in str(e):
+                    raise
+                node.record_error()
+                tries += 1
+            except (ClientError, ServerDisconnectedError, gaierror, asyncio.TimeoutError) as e:
+                node.record_error()
+                tries += 1
+            except jsonschema.ValidationError as e:
+                logging.debug(str(e))
+                node.record_error()
+                tries += 1
+        return None
+
+    def _request_done(self, cache_key, pending):
+        """
+        Forget a finished request so that the next identical request
+        is sent to the network
+
+        :param CacheKey cache_key: The cache key of the request
+        :param asyncio.Future pending: The finished request
+        """
+        self._pending_requests.pop(cache_key, None)
+        # The error is raised to the callers still waiting,
+        # but none of them could be waiting anymore
+        if not pending.cancelled():
+            pending.exception()
+
     async def future_request(self, request, req_args={}, get_args={}):
         """
         Start a request to the network and returns a future.
+        Identical requests sent while a previous one is still running
+        share its reply.
 
         :param class request: A bma request class calling for data
         :param dict req_args: Arguments to pass to the request constructor
@@ -230,24 +392,16 @@ class BmaAccess(QObject):
 
         nodes = self.filter_nodes(request, self._network.synced_nodes)
         if need_reload and len(nodes) > 0:
-            tries = 0
-            while tries < 3:
-                node = random.choice(nodes)
-                conn_handler = node.endpoint.conn_handler()
-                req = request(conn_handler, **req_args)
-                try:
-                    json_data = await req.get(**get_args)
-                    self._update_cache(request, req_args, get_args, json_data)
-                    return json_data
-                except ValueError as e:
-                    if '404' in str(e) or '400' in str(e):
-                        raise
-                    tries += 1
-                except (ClientError, ServerDisconnectedError, gaierror, asyncio.TimeoutError) as e:
-                    tries += 1
-                except jsonschema.ValidationError as e:
-                    logging.debug(str(e))
-                    tries += 1
+            cache_key = CacheKey.from_request(request, req_args, get_args)
+            if cache_key not in self._pending_requests:
+                pending = asyncio.ensure_future(self._request_nodes(request, req_args, get_args, nodes))
+                pending.add_done_callback(lambda f: self._request_done(cache_key, f))
+                self._pending_requests[cache_key] = pending
+            # The request is shielded so that cancelling one of the callers
+            # does not cancel the request of the others
+            reply = await asyncio.shield(self._pending_requests[cache_key])
+            if reply is not None:
+                return reply
         if len(nodes) == 0 or json_data is None:
             raise NoPeerAvailable("", len(nodes))
         return json_data
@@ -262,24 +416,9 @@ class BmaAccess(QObject):
         :return: The returned data
         """
         nodes = self.filter_nodes(request, self._network.synced_nodes)
+        json_data = None
         if len(nodes) > 0:
-            node = random.choice(nodes)
-            req = request(node.endpoint.conn_handler(), **req_args)
-            tries = 0
-            json_data = None
-            while tries < 3:
-                try:
-                    json_data = await req.get(**get_args)
-                    return json_data
-                except ValueError as e:
-                    if '404' in str(e) or '400' in str(e):
-                        raise
-                    tries += 1
-                except (ClientError, ServerDisconnectedError, gaierror, asyncio.TimeoutError) as e:
-                    tries += 1
-                except jsonschema.ValidationError as e:
-                    logging.debug(str(e))
-                    tries += 1
+            json_data = await self._request_nodes(request, req_args, get_args, nodes, cached=False)
         if len(nodes) == 0 or not json_data:
             raise NoPeerAvailable("", len(nodes))
         return json_data
@@ -305,8 +444,7 @@ class BmaAccess(QObject):
         if len(nodes) > 0:
             for node in nodes:
                 logging.debug("Trying to connect to : " + node.pubkey)
-                conn_handler = node.endpoint.conn_handler()
-                req = request(conn_handler, **req_args)
+                req = node.bma_request(request, **req_args)
                 reply = asyncio.ensure_future(req.post(**post_args))
                 replies.append(reply)
             self._invalidate_cache(request)
@@ -0,0 +1,583 @@
+from ucoinpy.api import bma
+from collections import OrderedDict, namedtuple
+import ast
+import bisect
+import hashlib
+import json
+import logging
+import sqlite3
+
+MAX_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 200
+MAX_ENTRIES = {
+    str(bma.blockchain.Block): 3000,
+    str(bma.wot.Lookup): 500,
+    str(bma.wot.CertifiersOf): 500,
+    str(bma.wot.CertifiedBy): 500,
+    str(bma.blockchain.Membership): 500,
+    str(bma.tx.Sources): 50,
+    str(bma.ud.History): 50,
+    str(bma.tx.History): 50,
+}
+BLOCK_REQUEST = str(bma.blockchain.Block)
+
+
+def canonical_json(data):
+    """
+    Serialize json data in a canonical form, with sorted keys, sorted lists and without spaces.
+    The nodes do not always send the elements of a list in the same order.
+
+    :param data: The json data
+    :rtype: str
+    """
+    if isinstance(data, dict):
+        return "{" + ",".join("{0}:{1}".format(json.dumps(k), canonical_json(data[k]))
+                              for k in sorted(data)) + "}"
+    if isinstance(data, list):
+        return "[" + ",".join(sorted(canonical_json(d) for d in data)) + "]"
+    return json.dumps(data)
+
+
+def json_digest(data):
+    """
+    Get the digest of json data.
+    Equal json data have the same digest, whatever the order of their keys and of their lists.
+
+    :param data: The json data
+    :return: The digest and the size of the serialized data
+    :rtype: tuple[str, int]
+    """
+    canonical = canonical_json(data)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest(), len(canonical)
+
+
+class CacheKey(namedtuple('CacheKey', ['request', 'req_args', 'get_args'])):
+    """
+    The key of a request in the cache.
+    The arguments are stored as tuples of (name, value) sorted by name.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_request(cls, request, req_args, get_args):
+        """
+        :param class request: A bma request class
+        :param dict req_args: Arguments to pass to the request constructor
+        :param dict get_args: Arguments to pass to the request __get__ method
+        :rtype: CacheKey
+        """
+        return cls(str(request), tuple(sorted(req_args.items())), tuple(sorted(get_args.items())))
+
+    @classmethod
+    def from_json(cls, json_data):
+        """
+        Load a key from its json format.
+        Keys saved by previous sakia versions are migrated.
+
+        :param list json_data: The key in json format
+        :return: The key, or None if it could not be migrated
+        :rtype: CacheKey
+        """
+        if len(json_data) == 5:
+            return cls._from_legacy(json_data)
+        return cls(json_data[0],
+                   tuple((name, value) for name, value in json_data[1]),
+                   tuple((name, value) for name, value in json_data[2]))
+
+    @classmethod
+    def _from_legacy(cls, json_data):
+        """
+        Migrate a key saved as five strings of sorted arguments names and values.
+        As names and values were sorted separately, only keys with
+        at most one argument of each kind can be migrated.
+
+        :param list json_data: The legacy key
+        :rtype: CacheKey
+        """
+        try:
+            args = []
+            for names, values in ((json_data[1], json_data[2]), (json_data[3], json_data[4])):
+                names = ast.literal_eval(names)
+                values = ast.literal_eval(values)
+                if len(names) > 1 or len(names) != len(values):
+                    return None
+                args.append(tuple(zip(names, values)))
+            return cls(json_data[0], args[0], args[1])
+        except (ValueError, SyntaxError):
+            return None
+
+    def jsonify(self):
+        """
+        :return: The key in json format
+        :rtype: list
+        """
+        return [self.request,
+                [[name, value] for name, value in self.req_args],
+                [[name, value] for name, value in self.get_args]]
+
+    def block_number(self):
+        """
+        :return: The number of the block if the key is the key of a block request, or None
+        :rtype: int
+        """
+        if self.request == BLOCK_REQUEST:
+            return self.arg('number')
+        return None
+
+    def arg(self, name):
+        """
+        Get the value of an argument of the request
+
+        :param str name: The argument name
+        :return: The value or None if the request has no such argument
+        """
+        for arg_name, value in self.req_args + self.get_args:
+            if arg_name == name:
+                return value
+        return None
+
+
+class BmaCache:
+    """
+    The cache of the BMA requests replies.
+    The cache is bounded by a number of entries for each request type
+    and by the total size of the cached json data.
+    Least recently used entries are evicted first, pinned entries are never evicted.
+
+    Entries of data which can not change anymore, like blocks older than the fork window,
+    are kept in a permanent tier, outside of these bounds.
+
+    The entries are indexed by request type, and the blocks of the other tier
+    are indexed by number, so that invalidating entries only touches the
+    affected ones.
+
+    When the cache is attached to a store, the changed entries are written
+    to the store when the cache is flushed, and the entries missing from the cache
+    are read from the store.
+    """
+    def __init__(self, max_entries=None, default_max_entries=DEFAULT_MAX_ENTRIES, max_size=MAX_SIZE):
+        """
+        :param dict max_entries: The maximum number of entries of request types
+        :param int default_max_entries: The maximum number of entries of other request types
+        :param int max_size: The maximum size of the cached json data, in bytes
+        """
+        self._max_entries = MAX_ENTRIES.copy()
+        if max_entries:
+            self._max_entries.update(max_entries)
+        self._default_max_entries = default_max_entries
+        self._max_size = max_size
+        # The entries of each request type, from the least to the most recently used
+        self._entries = {}
+        self._sizes = {}
+        self._requests_sizes = {}
+        self._size = 0
+        self._pinned = set()
+        self._permanent = {}
+        # The keys of the permanent entries of each request type
+        self._permanent_keys = {}
+        # The keys of the blocks which are not permanent, by block number
+        self._blocks = {}
+        self._blocks_numbers = []
+        # The keys of the blocks which could have been rolled back
+        self._unconfirmed = set()
+        # The number of the oldest stored block which could have been rolled back
+        self._stored_unconfirmed_from = None
+        self._store = None
+        # The changes not written to the store yet
+        self._dirty = {}
+        self._removed = set()
+        self._removed_requests = set()
+        # The changes being written to the store
+        self._flushing = []
+
+    def __contains__(self, key):
+        return key in self._sizes or key in self._permanent
+
+    def __len__(self):
+        return len(self._sizes) + len(self._permanent)
+
+    @property
+    def size(self):
+        return self._size
+
+    def keys(self):
+        return list(self._permanent.keys()) + [k for entries in self._entries.values() for k in entries.keys()]
+
+    def items(self):
+        return list(self._permanent.items()) + [(k, e) for entries in self._entries.values()
+                                                for k, e in entries.items()]
+
+    def is_permanent(self, key):
+        """
+        :param CacheKey key: The cache key
+        :return: True if the entry is in the permanent tier
+        :rtype: bool
+        """
+        return key in self._permanent
+
+    def get(self, key):
+        """
+        Get an entry and mark it as the most recently used of its request type
+
+        :param CacheKey key: The cache key
+        :return: The entry, or None if it is not cached
+        :rtype: dict
+        """
+        if key in self._permanent:
+            return self._permanent[key]
+        entries = self._entries.get(key.request)
+        if entries is not None and key in entries:
+            entries.move_to_end(key)
+            return entries[key]
+        return self._load(key)
+
+    def _load(self, key):
+        """
+        Read an entry missing from the cache in the store
+
+        :param CacheKey key: The cache key
+        :return: The entry, or None if it is not stored
+        :rtype: dict
+        """
+        if self._store is None:
+            return None
+        # Evicted entries are written to the store on the next flush,
+        # and removed entries are deleted from it
+        changes = [(self._dirty, self._removed, self._removed_requests)] \
+            + [c[:3] for c in reversed(self._flushing)]
+        entry = None
+        for dirty, removed, removed_requests in changes:
+            entry = dirty.get(key)
+            if entry is not None:
+                break
+            if key in removed or key.request in removed_requests:
+                return None
+        if entry is None:
+            entry = self._store.get(key)
+        if entry is None:
+            return None
+        permanent = entry['metadata'].get('permanent', False)
+        self._insert(key, entry, entry['metadata'].get('pinned', False), permanent)
+        number = key.block_number()
+        if not permanent and number is not None and self._stored_unconfirmed_from is not None \
+                and number >= self._stored_unconfirmed_from:
+            self._unconfirmed.add(key)
+        return entry
+
+    def put(self, key, entry, pinned=False, permanent=False):
+        """
+        Put an entry in the cache then evict the least recently used ones
+        if the cache exceeds its limits.
+        The digest and the size of the entry are computed if its metadata
+        do not hold them yet.
+
+        :param CacheKey key: The cache key
+        :param dict entry: The entry with its 'metadata' and 'value'
+        :param bool pinned: True if the entry must never be evicted
+        :param bool permanent: True if the entry can not change anymore
+        """
+        metadata = entry['metadata']
+        if 'digest' not in metadata or 'size' not in metadata:
+            metadata['digest'], metadata['size'] = json_digest(entry['value'])
+        if pinned:
+            metadata['pinned'] = True
+
+        self._insert(key, entry, pinned, permanent)
+        if self._store is not None:
+            self._dirty[key] = entry
+            self._removed.discard(key)
+
+    def _insert(self, key, entry, pinned, permanent):
+        """
+        Insert an entry in the tiers and the indexes of the cache
+
+        :param CacheKey key: The cache key
+        :param dict entry: The entry with its 'metadata' and 'value'
+        :param bool pinned: True if the entry must never be evicted
+        :param bool permanent: True if the entry can not change anymore
+        """
+        metadata = entry['metadata']
+        if key in self:
+            self._remove(key)
+        if permanent:
+            metadata['permanent'] = True
+            self._permanent[key] = entry
+            self._permanent_keys.setdefault(key.request, set()).add(key)
+            return
+
+        entries = self._entries.setdefault(key.request, OrderedDict())
+        entries[key] = entry
+        size = metadata['size']
+        self._sizes[key] = size
+        self._requests_sizes[key.request] = self._requests_sizes.get(key.request, 0) + size
+        self._size += size
+        if pinned:
+            self._pinned.add(key)
+        number = key.block_number()
+        if number is not None:
+            self._blocks[number] = key
+            bisect.insort(self._blocks_numbers, number)
+        self._evict(key.request)
+
+    def promote(self, key):
+        """
+        Move an entry to the permanent tier
+
+        :param CacheKey key: The cache key
+        """
+        if key not in self._permanent:
+            entry = self._remove(key)
+            self.put(key, entry, entry['metadata'].get('pinned', False), permanent=True)
+
+    def update(self, key, data, metadata, pinned=False, permanent=False):
+        """
+        Update the data of an entry.
+        The digest of the data is compared to the digest of the cached data.
+
+        :param CacheKey key: The cache key
+        :param data: The json data
+        :param dict metadata: The metadata of the entry
+        :param bool pinned: True if the entry must never be evicted
+        :param bool permanent: True if the data can not change anymore
+        :return: True if the cached data changed
+        :rtype: bool
+        """
+        digest, size = json_digest(data)
+        entry = self.get(key)
+        if entry and entry['metadata'].get('digest') == digest:
+            entry['metadata'].update(metadata)
+            if permanent:
+                self.promote(key)
+            elif self._store is not None:
+                self._dirty[key] = entry
+            return False
+
+        metadata['digest'] = digest
+        metadata['size'] = size
+        self.put(key, {'metadata': metadata, 'value': data}, pinned, permanent)
+        return True
+
+    def digest(self, key):
+        """
+        Get the digest of cached data
+
+        :param CacheKey key: The cache key
+        :return: The digest, or None if the data is not cached
+        :rtype: str
+        """
+        if key in self._permanent:
+            return self._permanent[key]['metadata'].get('digest')
+        entries = self._entries.get(key.request)
+        if entries is not None and key in entries:
+            return entries[key]['metadata'].get('digest')
+        entry = self._load(key)
+        if entry:
+            return entry['metadata'].get('digest')
+        return None
+
+    def pop(self, key):
+        """
+        Remove an entry from the cache and from its store
+
+        :param CacheKey key: The cache key
+        :return: The removed entry, or None if it was not cached
+        :rtype: dict
+        """
+        entry = self._remove(key) if key in self else None
+        if self._store is not None:
+            self._dirty.pop(key, None)
+            self._removed.add(key)
+        return entry
+
+    def _remove(self, key):
+        """
+        Remove an entry from the tiers and the indexes of the cache
+
+        :param CacheKey key: The cache key
+        :return: The removed entry
+        :rtype: dict
+        """
+        if key in self._permanent:
+            entry = self._permanent.pop(key)
+            self._permanent_keys[key.request].discard(key)
+            entry['metadata'].pop('permanent', None)
+            return entry
+        entry = self._entries[key.request].pop(key)
+        size = self._sizes.pop(key)
+        self._requests_sizes[key.request] -= size
+        self._size -= size
+        self._pinned.discard(key)
+        self._unconfirmed.discard(key)
+        number = key.block_number()
+        if number is not None:
+            del self._blocks[number]
+            del self._blocks_numbers[bisect.bisect_left(self._blocks_numbers, number)]
+        return entry
+
+    def pop_request(self, request):
+        """
+        Remove all the entries of a request type from the cache and from its store
+
+        :param str request: The request type
+        """
+        for key in list(self._entries.get(request, {}).keys()):
+            self._remove(key)
+        for key in list(self._permanent_keys.get(request, ())):
+            self._remove(key)
+        if self._store is not None:
+            for key in [k for k in self._dirty if k.request == request]:
+                self._dirty.pop(key)
+            self._removed_requests.add(request)
+
+    def unconfirm_blocks(self, number):
+        """
+        Mark the blocks which are not permanent, from a block number,
+        as blocks which could have been rolled back
+
+        :param int number: The number of the first block which could have been rolled back
+        """
+        start = bisect.bisect_left(self._blocks_numbers, number)
+        self._unconfirmed.update(self._blocks[n] for n in self._blocks_numbers[start:])
+        if self._store is not None:
+            if self._stored_unconfirmed_from is None or number < self._stored_unconfirmed_from:
+                self._stored_unconfirmed_from = number
+
+    def confirm_blocks(self, number):
+        """
+        Mark the blocks up to a block number as blocks which were not rolled back
+
+        :param int number: The number of the last block which was not rolled back
+        """
+        for key in [k for k in self._unconfirmed if k.arg('number') <= number]:
+            self._unconfirmed.discard(key)
+        if self._stored_unconfirmed_from is not None and number >= self._stored_unconfirmed_from:
+            self._stored_unconfirmed_from = number + 1
+
+    def confirmed(self, key):
+        """
+        :param CacheKey key: The cache key
+        :return: False if the entry is a block which could have been rolled back
+        :rtype: bool
+        """
+        return key not in self._unconfirmed
+
+    @property
+    def unconfirmed_from(self):
+        """
+        :return: The number of the oldest block which could have been rolled back, or None
+        :rtype: int
+        """
+        numbers = [k.arg('number') for k in self._unconfirmed]
+        if self._stored_unconfirmed_from is not None:
+            numbers.append(self._stored_unconfirmed_from)
+        if numbers:
+            return min(numbers)
+        return None
+
+    @property
+    def store(self):
+        return self._store
+
+    def attach(self, store):
+        """
+        Attach the cache to a store.
+        The entries already in the cache are written to the store on the next flush.
+
+        :param sakia.core.net.api.bma.store.BmaStore store: The store
+        """
+        self._store = store
+        self._dirty = dict(self.items())
+        stored_unconfirmed_from = store.state('unconfirmed_from')
+        if stored_unconfirmed_from is not None:
+            self.unconfirm_blocks(stored_unconfirmed_from)
+
+    def begin_flush(self):
+        """
+        Take the changes of the cache to write them to its store.
+        The entries are copied so that they can be written out of the event loop,
+        and the changes are still read by the cache until end_flush is called.
+
+        :return: The arguments of BmaStore.save, or None if the cache has no store
+        :rtype: tuple
+        """
+        if self._store is None:
+            return None
+        entries = dict((k, {'metadata': dict(e['metadata']), 'value': e['value']})
+                       for k, e in self._dirty.items())
+        changes = (entries, self._removed, self._removed_requests,
+                   {'unconfirmed_from': self.unconfirmed_from})
+        self._flushing.append(changes)
+        self._dirty = {}
+        self._removed = set()
+        self._removed_requests = set()
+        return changes
+
+    def end_flush(self, changes, written=True):
+        """
+        Forget the changes taken by begin_flush.
+        The changes which could not be written are written on the next flush,
+        unless they were replaced meanwhile.
+
+        :param tuple changes: The changes returned by begin_flush
+        :param bool written: False if the changes could not be written
+        """
+        self._flushing = [c for c in self._flushing if c is not changes]
+        if not written:
+            entries, removed, removed_requests, state = changes
+            for key, entry in entries.items():
+                if key not in self._dirty and key not in self._removed \
+                        and key.request not in self._removed_requests:
+                    self._dirty[key] = entry
+            self._removed |= set(k for k in removed if k not in self._dirty)
+            self._removed_requests |= removed_requests
+
+    def flush(self):
+        """
+        Write the changes of the cache to its store
+        """
+        changes = self.begin_flush()
+        if changes is not None:
+            try:
+                self._store.save(*changes)
+            except sqlite3.Error:
+                self.end_flush(changes, written=False)
+                raise
+            self.end_flush(changes)
+
+    def close(self):
+        """
+        Flush the cache and close its store.
+        The cache keeps its entries in memory only.
+        """
+        if self._store is not None:
+            self.flush()
+            self._store.close()
+            self._store = None
+
+    def _evictable(self, request):
+        return (k for k in self._entries[request] if k not in self._pinned)
+
+    def _evict(self, request):
+        """
+        Evict the least recently used entries of the request type
+        while it has too many entries, then the least recently used entries
+        of the biggest request types while the cache is too big.
+
+        :param str request: The request type of the latest inserted entry
+        """
+        max_entries = self._max_entries.get(request, self._default_max_entries)
+        excess = len(self._entries[request]) - max_entries
+        if excess > 0:
+            for key in [k for k, _ in zip(self._evictable(request), range(excess))]:
+                self._remove(key)
+
+        while self._size > self._max_size:
+            requests = sorted(self._requests_sizes.keys(), key=lambda r: self._requests_sizes[r], reverse=True)
+            for r in requests:
+                key = next(self._evictable(r), None)
+                if key:
+                    self._remove(key)
+                    break
+            else:
+                logging.debug("Cache is full of pinned entries")
+                break
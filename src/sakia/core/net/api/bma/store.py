@@ -0,0 +1,95 @@
+import json
+import logging
+import sqlite3
+
+
+class BmaStore:
+    """
+    The persistent store of the BMA cache, in a sqlite database.
+    Entries are saved one by one, so that saving the cache only writes
+    the entries which changed, and are read when they are missing from the cache.
+    The changes are written with their own connection, which can be used out of the event loop.
+    """
+    def __init__(self, path):
+        """
+        :param str path: The path of the database file
+        """
+        self._path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._write_conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                                    request TEXT NOT NULL,
+                                    req_args TEXT NOT NULL,
+                                    get_args TEXT NOT NULL,
+                                    metadata TEXT NOT NULL,
+                                    value TEXT NOT NULL,
+                                    PRIMARY KEY (request, req_args, get_args))""")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS state (
+                                    name TEXT PRIMARY KEY,
+                                    value TEXT)""")
+
+    @property
+    def path(self):
+        return self._path
+
+    @staticmethod
+    def _row_key(key):
+        json_key = key.jsonify()
+        return json_key[0], json.dumps(json_key[1]), json.dumps(json_key[2])
+
+    def get(self, key):
+        """
+        Read an entry
+
+        :param sakia.core.net.api.bma.cache.CacheKey key: The cache key
+        :return: The entry, or None if it is not stored
+        :rtype: dict
+        """
+        row = self._conn.execute("""SELECT metadata, value FROM entries
+                                    WHERE request=? AND req_args=? AND get_args=?""",
+                                 BmaStore._row_key(key)).fetchone()
+        if row:
+            return {'metadata': json.loads(row[0]),
+                    'value': json.loads(row[1])}
+        return None
+
+    def state(self, name):
+        """
+        Read a value of the state of the cache
+
+        :param str name: The name of the value
+        :return: The json value, or None if it is not stored
+        """
+        row = self._conn.execute("SELECT value FROM state WHERE name=?", (name,)).fetchone()
+        if row:
+            return json.loads(row[0])
+        return None
+
+    def save(self, entries, removed, removed_requests, state):
+        """
+        Write the changes of the cache in a single transaction.
+        Only one thread at a time can write the changes.
+
+        :param dict entries: The entries to insert or update, by cache key
+        :param set removed: The keys of the entries to delete
+        :param set removed_requests: The request types whose entries must all be deleted
+        :param dict state: The values of the state of the cache to write
+        """
+        with self._write_conn:
+            self._write_conn.executemany("DELETE FROM entries WHERE request=?",
+                                         ((r,) for r in removed_requests))
+            self._write_conn.executemany("DELETE FROM entries WHERE request=? AND req_args=? AND get_args=?",
+                                         (BmaStore._row_key(k) for k in removed))
+            self._write_conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                                         (BmaStore._row_key(k) + (json.dumps(e['metadata']), json.dumps(e['value']))
+                                          for k, e in entries.items()))
+            self._write_conn.executemany("INSERT OR REPLACE INTO state VALUES (?, ?)",
+                                         ((name, json.dumps(value)) for name, value in state.items()))
+        logging.debug("Stored {0} entries, deleted {1} entries".format(len(entries), len(removed)))
+
+    def close(self):
+        self._write_conn.close()
+        self._conn.close()
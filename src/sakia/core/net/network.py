@@ -4,6 +4,7 @@ Created on 24 févr. 2015
 @author: inso
 """
 from .node import Node
+from .pool import SessionsPool
 from ...tools.exceptions import InvalidNodeCurrency
 import logging
 import statistics
@@ -15,6 +16,7 @@ from PyQt5.QtCore import pyqtSignal, pyqtSlot, QObject, QTimer
 from collections import Counter
 
 MAX_CONFIRMATIONS = 6
+DEFAULT_FORK_WINDOW = 100
 
 
 class Network(QObject):
@@ -35,6 +37,7 @@ class Network(QObject):
         :param list nodes: The root nodes of the network
         """
         super().__init__()
+        self._pool = SessionsPool()
         self._root_nodes = nodes
         self._nodes = []
         for n in nodes:
@@ -140,12 +143,20 @@ class Network(QObject):
         for node in self.nodes:
             close_tasks.append(asyncio.ensure_future(node.close_ws()))
         await asyncio.wait(close_tasks, timeout=15)
+        await self._pool.close()
         logging.debug("Closed")
 
 
     def continue_crawling(self):
         return self._must_crawl
 
+    @property
+    def pool(self):
+        """
+        Get the sessions pool used to request the nodes
+        """
+        return self._pool
+
     @property
     def synced_nodes(self):
         """
@@ -174,6 +185,21 @@ class Network(QObject):
         """
         return self._root_nodes
 
+    @property
+    def current_block(self):
+        """
+        Get the json data of the latest block considered valid,
+        as it was pushed or sent by the nodes
+
+        :return: The block data, or None if no block is known
+        :rtype: dict
+        """
+        blocks = [n.block for n in self.synced_nodes if n.block]
+        if len(blocks) > 0:
+            return blocks[0]
+        else:
+            return None
+
     @property
     def current_blockid(self):
         """
@@ -186,6 +212,18 @@ class Network(QObject):
         else:
             return BlockId.empty()
 
+    @property
+    def fork_window(self):
+        """
+        Get the number of blocks which can be rolled back on the network.
+        If the nodes did not send their fork window, the default one of ucoin is used.
+        """
+        fork_windows = [n.fork_window for n in self.synced_nodes if n.fork_window]
+        if len(fork_windows) > 0:
+            return max(fork_windows)
+        else:
+            return DEFAULT_FORK_WINDOW
+
     def _check_nodes_sync(self):
         """
         Check nodes sync with the following rules :
@@ -278,6 +316,7 @@ class Network(QObject):
         Add a nod to the network.
         """
         self._nodes.append(node)
+        node.pool = self._pool
         node.changed.connect(self.handle_change)
         node.error.connect(self.handle_error)
         node.identity_changed.connect(self.handle_identity_change)
@@ -363,6 +402,7 @@ class Network(QObject):
         if node.state in (Node.OFFLINE, Node.CORRUPTED) and \
                                 node.last_change + 3600 < time.time():
             node.disconnect()
+            self._pool.release(node.endpoint)
             self.nodes.remove(node)
             self.nodes_changed.emit()
 
@@ -8,6 +8,7 @@ from ucoinpy.documents.peer import Peer, Endpoint, BMAEndpoint
 from ucoinpy.documents import Block, BlockId, MalformedDocumentError
 from ...tools.exceptions import InvalidNodeCurrency
 from ...tools.decorators import asyncify
+from ...tools.documents import parse_peer
 from ucoinpy.api import bma as bma
 from ucoinpy.api.bma import ConnectionHandler
 
@@ -24,6 +25,9 @@ from socket import gaierror
 
 from PyQt5.QtCore import QObject, pyqtSignal
 
+EWMA_ALPHA = 0.3
+ERROR_PENALTY = 15
+
 
 class Node(QObject):
     """
@@ -64,6 +68,10 @@ class Node(QObject):
         self._version = version
         self._fork_window = fork_window
         self._refresh_counter = 19
+        self._pool = None
+        self._latency = None
+        self._errors = 0
+        self._in_flight = 0
         self._ws_tasks = {'block': None,
                     'peer': None}
         self._connected = {'block': False,
@@ -88,8 +96,8 @@ class Node(QObject):
         """
         peer_data = await bma.network.Peering(ConnectionHandler(address, port)).get()
 
-        peer = Peer.from_signed_raw("{0}{1}\n".format(peer_data['raw'],
-                                                  peer_data['signature']))
+        peer = parse_peer("{0}{1}\n".format(peer_data['raw'],
+                                             peer_data['signature']))
 
         if currency is not None:
             if peer.currency != currency:
@@ -176,7 +184,7 @@ class Node(QObject):
 
             peer = Peer("1", currency, pubkey, BlockId(0, Block.Empty_Hash), endpoints, "SOMEFAKESIGNATURE")
         else:
-            peer = Peer.from_signed_raw(data['peer'])
+            peer = parse_peer(data['peer'])
 
         node = cls(peer, uid, pubkey, block,
                    state, last_change,
@@ -231,6 +239,88 @@ class Node(QObject):
     def endpoint(self) -> BMAEndpoint:
         return next((e for e in self._peer.endpoints if type(e) is BMAEndpoint))
 
+    @property
+    def pool(self):
+        return self._pool
+
+    @pool.setter
+    def pool(self, pool):
+        """
+        Set the sessions pool used to request this node
+
+        :param sakia.core.net.pool.SessionsPool pool: The sessions pool of the network
+        """
+        self._pool = pool
+
+    def bma_request(self, request, *args, **kwargs):
+        """
+        Instanciate a bma request to this node.
+        The request is sent through the sessions pool of the network if the node has one.
+
+        :param class request: A bma request class
+        :return: The request object
+        """
+        if self._pool:
+            return self._pool.request(request, self.endpoint, *args, **kwargs)
+        else:
+            return request(self.endpoint.conn_handler(), *args, **kwargs)
+
+    async def timed_get(self, req, **get_args):
+        """
+        Send a bma GET request and feed the latency estimation of this node
+        with its duration
+
+        :param ucoinpy.api.bma.API req: The request to send
+        :param dict get_args: Arguments to pass to the request __get__ method
+        :return: The json data
+        """
+        self._in_flight += 1
+        try:
+            start = time.monotonic()
+            data = await req.get(**get_args)
+            self.record_reply(time.monotonic() - start)
+            return data
+        finally:
+            self._in_flight -= 1
+
+    def record_reply(self, duration):
+        """
+        Update the latency and errors moving averages with a successful reply
+
+        :param float duration: The reply duration in seconds
+        """
+        if self._latency is None:
+            self._latency = duration
+        else:
+            self._latency += EWMA_ALPHA * (duration - self._latency)
+        self._errors -= EWMA_ALPHA * self._errors
+
+    def record_error(self):
+        """
+        Update the errors moving average with a failed request
+        """
+        self._errors += EWMA_ALPHA * (1 - self._errors)
+
+    @property
+    def latency(self):
+        return self._latency
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    @property
+    def score(self):
+        """
+        The expected cost of a request to this node, in seconds.
+        An error costs as much as a request timeout, and each request
+        still running on the node delays the new one by its latency,
+        so that concurrent requests are spread across the nodes.
+        Nodes never requested get the best score so that they are tried.
+        """
+        latency = self._latency if self._latency is not None else 0
+        return latency * (1 + self._in_flight) + self._errors * ERROR_PENALTY
+
     @property
     def block(self):
         return self._block
@@ -299,6 +389,9 @@ class Node(QObject):
         #logging.debug("{:} | Last state : {:} / new state : {:}".format(self.pubkey[:5],
         #                                                               self.state, new_state))
 
+        if new_state in (Node.OFFLINE, Node.CORRUPTED):
+            self.record_error()
+
         if self._state != new_state:
             self.last_change = time.time()
             self._state = new_state
@@ -380,8 +473,7 @@ class Node(QObject):
         If an error occurs, the node is considered offline
         """
         try:
-            conn_handler = self.endpoint.conn_handler()
-            block_data = await bma.blockchain.Current(conn_handler).get()
+            block_data = await self.timed_get(self.bma_request(bma.blockchain.Current))
             await self.refresh_block(block_data)
         except ValueError as e:
             if '404' in str(e):
@@ -405,17 +497,14 @@ class Node(QObject):
         Refresh the blocks of this node
         :param dict block_data: The block data in json format
         """
-        conn_handler = self.endpoint.conn_handler()
-
-        logging.debug("Requesting {0}".format(conn_handler))
         block_hash = block_data['hash']
         self.state = Node.ONLINE
 
         if not self.block or block_hash != self.block['hash']:
             try:
                 if self.block:
-                    self.main_chain_previous_block = await bma.blockchain.Block(conn_handler,
-                                                                                 self.block['number']).get()
+                    self.main_chain_previous_block = await self.timed_get(self.bma_request(bma.blockchain.Block,
+                                                                                              self.block['number']))
             except ValueError as e:
                 if '404' in str(e):
                     self.main_chain_previous_block = None
@@ -442,18 +531,16 @@ class Node(QObject):
         """
         Refresh basic information (pubkey and currency)
         """
-        conn_handler = self.endpoint.conn_handler()
-
         try:
-            peering_data = await bma.network.Peering(conn_handler).get()
+            peering_data = await self.timed_get(self.bma_request(bma.network.Peering))
             node_pubkey = peering_data["pubkey"]
             node_currency = peering_data["currency"]
             self.state = Node.ONLINE
 
             if peering_data['raw'] != self.peer.raw():
-                peer = Peer.from_signed_raw("{0}{1}\n".format(peering_data['raw'], peering_data['signature']))
+                peer = parse_peer("{0}{1}\n".format(peering_data['raw'], peering_data['signature']))
                 if peer.blockid.number > peer.blockid.number:
-                    self.peer = Peer.from_signed_raw("{0}{1}\n".format(peering_data['raw'], peering_data['signature']))
+                    self.peer = peer
 
             if node_pubkey != self.pubkey:
                 self._pubkey = node_pubkey
@@ -481,10 +568,8 @@ class Node(QObject):
         """
         Refresh the summary of this node
         """
-        conn_handler = self.endpoint.conn_handler()
-
         try:
-            summary_data = await bma.node.Summary(conn_handler).get()
+            summary_data = await self.timed_get(self.bma_request(bma.node.Summary))
             self.software = summary_data["ucoin"]["software"]
             self.version = summary_data["ucoin"]["version"]
             self.state = Node.ONLINE
@@ -509,9 +594,8 @@ class Node(QObject):
         """
         Refresh the node UID
         """
-        conn_handler = self.endpoint.conn_handler()
         try:
-            data = await bma.wot.Lookup(conn_handler, self.pubkey).get()
+            data = await self.timed_get(self.bma_request(bma.wot.Lookup, self.pubkey))
             self.state = Node.ONLINE
             timestamp = 0
             uid = ""
@@ -583,17 +667,16 @@ class Node(QObject):
         """
         Refresh the list of peers knew by this node
         """
-        conn_handler = self.endpoint.conn_handler()
-
         try:
-            peers_data = await bma.network.peering.Peers(conn_handler).get(leaves='true')
+            peers_data = await self.timed_get(self.bma_request(bma.network.peering.Peers), leaves='true')
             self.state = Node.ONLINE
             if peers_data['root'] != self._last_merkle['root']:
                 leaves = [leaf for leaf in peers_data['leaves']
                           if leaf not in self._last_merkle['leaves']]
                 for leaf_hash in leaves:
                     try:
-                        leaf_data = await bma.network.peering.Peers(conn_handler).get(leaf=leaf_hash)
+                        leaf_data = await self.timed_get(self.bma_request(bma.network.peering.Peers),
+                                                         leaf=leaf_hash)
                         self.refresh_peer_data(leaf_data['leaf']['value'])
                     except (AttributeError, ValueError) as e:
                         logging.debug("{pubkey} : Incorrect peer data in {leaf}".format(pubkey=self.pubkey[:5],
@@ -626,7 +709,7 @@ class Node(QObject):
             try:
                 str_doc = "{0}{1}\n".format(peer_data['raw'],
                                             peer_data['signature'])
-                peer_doc = Peer.from_signed_raw(str_doc)
+                peer_doc = parse_peer(str_doc)
                 pubkey = peer_data['pubkey']
                 self.neighbour_found.emit(peer_doc, pubkey)
             except MalformedDocumentError as e:
@@ -0,0 +1,147 @@
+import aiohttp
+import asyncio
+import functools
+import logging
+import time
+from ucoinpy.api.bma import ConnectionHandler
+
+MAX_CONNECTIONS_PER_NODE = 4
+IDLE_TIMEOUT = 60
+
+
+class PooledConnectionHandler(ConnectionHandler):
+    """
+    A connection handler carrying the keep-alive session of its endpoint
+    """
+    def __init__(self, server, port, session):
+        """
+        :param str server: The server address
+        :param int port: The server port
+        :param aiohttp.ClientSession session: The session used to send requests
+        """
+        super().__init__(server, port)
+        self.session = session
+
+
+async def _pooled_get(api, path, **kwargs):
+    """
+    Same as ucoinpy API.requests_get, but sent through the session
+    of the connection handler.
+
+    :param ucoinpy.api.bma.API api: The request
+    :param str path: The request path
+    """
+    logging.debug("Request : {0}".format(api.reverse_url("http", path)))
+    with aiohttp.Timeout(15):
+        response = await api.connection_handler.session.get(api.reverse_url("http", path),
+                                                            params=kwargs, headers=api.headers)
+        if response.status != 200:
+            raise ValueError('status code != 200 => %d (%s)' % (response.status, (await response.text())))
+
+        return response
+
+
+async def _pooled_post(api, path, **kwargs):
+    """
+    Same as ucoinpy API.requests_post, but sent through the session
+    of the connection handler.
+
+    :param ucoinpy.api.bma.API api: The request
+    :param str path: The request path
+    """
+    if 'self_' in kwargs:
+        kwargs['self'] = kwargs.pop('self_')
+
+    logging.debug("POST : {0}".format(kwargs))
+    with aiohttp.Timeout(15):
+        response = await api.connection_handler.session.post(api.reverse_url("http", path),
+                                                             data=kwargs, headers=api.headers)
+        return response
+
+
+class SessionsPool:
+    """
+    A pool of keep-alive http sessions, one for each node endpoint.
+    Sessions which were not used for a while are closed.
+    """
+    def __init__(self, limit=MAX_CONNECTIONS_PER_NODE, idle_timeout=IDLE_TIMEOUT):
+        """
+        :param int limit: The maximum number of simultaneous connections to a node
+        :param int idle_timeout: The number of seconds before closing an unused session
+        """
+        self._limit = limit
+        self._idle_timeout = idle_timeout
+        self._sessions = {}
+        self._last_used = {}
+
+    @staticmethod
+    def _key(conn_handler):
+        return conn_handler.server, conn_handler.port
+
+    def session(self, endpoint):
+        """
+        Get the session of an endpoint, creating it if needed
+
+        :param ucoinpy.documents.peer.BMAEndpoint endpoint: The node endpoint
+        :return: the session and the connection handler of the endpoint
+        :rtype: tuple[aiohttp.ClientSession, ucoinpy.api.bma.ConnectionHandler]
+        """
+        conn_handler = endpoint.conn_handler()
+        key = SessionsPool._key(conn_handler)
+        self.evict_idle(keep=key)
+        if key not in self._sessions:
+            logging.debug("New session : {0}".format(conn_handler))
+            connector = aiohttp.TCPConnector(limit=self._limit)
+            self._sessions[key] = aiohttp.ClientSession(connector=connector)
+        self._last_used[key] = time.monotonic()
+        return self._sessions[key], conn_handler
+
+    def request(self, request, endpoint, *args, **kwargs):
+        """
+        Instanciate a bma request sent through the session of the endpoint
+
+        :param class request: A bma request class
+        :param ucoinpy.documents.peer.BMAEndpoint endpoint: The node endpoint
+        :return: The request object
+        """
+        session, conn_handler = self.session(endpoint)
+        pooled_handler = PooledConnectionHandler(conn_handler.server, conn_handler.port, session)
+        req = request(pooled_handler, *args, **kwargs)
+        req.requests_get = functools.partial(_pooled_get, req)
+        req.requests_post = functools.partial(_pooled_post, req)
+        return req
+
+    def evict_idle(self, keep=None):
+        """
+        Close sessions which were not used since the idle timeout
+
+        :param tuple keep: The key of a session which must not be closed
+        """
+        now = time.monotonic()
+        for key in [k for k, t in self._last_used.items()
+                    if k != keep and now - t > self._idle_timeout]:
+            logging.debug("Closing idle session : {0}:{1}".format(*key))
+            self._close_session(key)
+
+    def release(self, endpoint):
+        """
+        Close the session of an endpoint
+
+        :param ucoinpy.documents.peer.BMAEndpoint endpoint: The node endpoint
+        """
+        key = SessionsPool._key(endpoint.conn_handler())
+        if key in self._sessions:
+            self._close_session(key)
+
+    def _close_session(self, key):
+        session = self._sessions.pop(key)
+        self._last_used.pop(key, None)
+        session.close()
+
+    async def close(self):
+        """
+        Close all the sessions of the pool
+        """
+        for key in list(self._sessions.keys()):
+            self._close_session(key)
+        await asyncio.sleep(0)
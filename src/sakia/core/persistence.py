@@ -0,0 +1,114 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+from collections import OrderedDict
+from PyQt5.QtCore import QObject, QTimer
+
+FLUSH_DELAY = 5000
+
+
+def write_json(path, data, indent=None):
+    """
+    Write json data to a file.
+    The data is written to a buffer file which then replaces the file,
+    so that the file is never left half written.
+
+    :param str path: The file path
+    :param dict data: The data in json format
+    :param int indent: The indentation of the json document
+    """
+    content = json.dumps(data, indent=indent, sort_keys=indent is not None)
+    buffer_path = path + ".buf"
+    with open(buffer_path, 'w') as outfile:
+        outfile.write(content)
+    shutil.move(buffer_path, path)
+
+
+def write_json_files(writes):
+    """
+    :param list[tuple] writes: The path, the data and the indentation of each file to write
+    """
+    for path, data, indent in writes:
+        write_json(path, data, indent)
+
+
+class Persistence(QObject):
+    """
+    Saves the application files in the background.
+    Objects are marked as dirty when they change and the files of the dirty objects
+    are written together, out of the event loop, a few seconds later.
+    """
+    def __init__(self, loop, delay=FLUSH_DELAY):
+        """
+        :param quamash.QEventLoop loop: The event loop
+        :param int delay: The delay before writing the dirty files, in milliseconds
+        """
+        super().__init__()
+        self._loop = loop
+        self._dirty = OrderedDict()
+        self._lock = asyncio.Lock(loop=loop)
+        self._timer = QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(lambda: asyncio.ensure_future(self.flush(), loop=self._loop))
+
+    @property
+    def dirty(self):
+        """
+        :return: The paths of the files which were not written yet
+        :rtype: list[str]
+        """
+        return list(self._dirty.keys())
+
+    def mark_dirty(self, path, jsonify, indent=None):
+        """
+        Mark the file of an object as dirty.
+        The object is serialized when the file is written,
+        so marking it again before the flush costs nothing.
+        The json data is encoded out of the event loop, so it must not
+        share mutable dicts or lists with the object.
+
+        :param str path: The file path
+        :param callable jsonify: Returns the object in json format, in new dicts and lists
+        :param int indent: The indentation of the json document
+        """
+        self._dirty[path] = (jsonify, indent)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def discard(self, path):
+        """
+        Forget the dirty files in a directory which is removed
+
+        :param str path: The directory path
+        """
+        for dirty_path in [p for p in self._dirty if p.startswith(os.path.join(path, ''))]:
+            self._dirty.pop(dirty_path)
+
+    async def flush(self):
+        """
+        Write the dirty files.
+        The objects are converted to json data in the event loop, as they could
+        be modified by other coroutines, then the data is encoded
+        and written in an executor.
+        If the files could not be written, they are marked as dirty again.
+        """
+        self._timer.stop()
+        with (await self._lock):
+            if not self._dirty:
+                return
+            writes = [(path, jsonify(), indent) for path, (jsonify, indent) in self._dirty.items()]
+            dirty, self._dirty = self._dirty, OrderedDict()
+            logging.debug("Writing {0} files".format(len(writes)))
+            try:
+                await self._loop.run_in_executor(None, write_json_files, writes)
+            except OSError as e:
+                logging.error("Could not write the files : {0}".format(str(e)))
+                # The files marked again during the write keep their newer serializer
+                for path, entry in dirty.items():
+                    if path not in self._dirty:
+                        self._dirty[path] = entry
+                if not self._timer.isActive():
+                    self._timer.start()
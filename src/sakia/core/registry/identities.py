@@ -1,4 +1,5 @@
 from ucoinpy.api import bma
+from ucoinpy.documents import BlockId
 from .identity import Identity, LocalState, BlockchainState
 
 import json
@@ -6,6 +7,11 @@ import asyncio
 import logging
 from aiohttp.errors import ClientError
 from ...tools.exceptions import NoPeerAvailable
+from ...tools.documents import parse_block
+
+FIND_CONCURRENCY = 8
+NOT_FOUND_TTL = 20
+MEMBERS_MAX_BLOCKS = 10
 
 
 class IdentitiesRegistry:
@@ -21,6 +27,11 @@ class IdentitiesRegistry:
         :rtype: IdentitiesRegistry
         """
         self._instances = instances
+        self._lookups = {}
+        self._not_found = {}
+        self._members = {}
+        self._members_digests = {}
+        self._members_blocks = {}
 
     def load_json(self, json_data):
         """
@@ -61,6 +72,34 @@ class IdentitiesRegistry:
             self._instances[community.currency] = {}
             return self._identities(community)
 
+    def _set_not_found(self, pubkey, community):
+        """
+        Remember that an identity could not be found on the network
+        so that it is not looked up again before some blocks
+
+        :param str pubkey: The pubkey of the identity
+        :param sakia.core.Community community: The community where the identity was looked up
+        """
+        not_found = self._not_found.setdefault(community.currency, {})
+        not_found[pubkey] = community.network.current_blockid.number
+
+    def _known_not_found(self, pubkey, community):
+        """
+        Check if an identity was not found on the network during the last blocks
+
+        :param str pubkey: The pubkey of the identity
+        :param sakia.core.Community community: The community where the identity is looked up
+        :return: True if the identity should not be looked up again yet
+        :rtype: bool
+        """
+        block_number = self._not_found.get(community.currency, {}).get(pubkey)
+        if block_number is None:
+            return False
+        if community.network.current_blockid.number < block_number + NOT_FOUND_TTL:
+            return True
+        self._not_found[community.currency].pop(pubkey)
+        return False
+
     async def _find_by_lookup(self, pubkey, community):
         identity = self._identities(community)[pubkey]
         lookup_tries = 0
@@ -69,8 +108,10 @@ class IdentitiesRegistry:
                 data = await community.bma_access.simple_request(bma.wot.Lookup,
                                                             req_args={'search': pubkey})
                 timestamp = 0
+                found = False
                 for result in data['results']:
                     if result["pubkey"] == identity.pubkey:
+                        found = True
                         uids = result['uids']
                         for uid_data in uids:
                             if uid_data["meta"]["timestamp"] > timestamp:
@@ -79,8 +120,13 @@ class IdentitiesRegistry:
                                 identity.blockchain_state = BlockchainState.BUFFERED
                                 identity.local_state = LocalState.PARTIAL
                                 timestamp = identity.sigdate
+                if not found:
+                    self._set_not_found(pubkey, community)
                 return identity
-            except ValueError:
+            except ValueError as e:
+                if '404' in str(e):
+                    self._set_not_found(pubkey, community)
+                    return identity
                 lookup_tries += 1
             except asyncio.TimeoutError:
                 lookup_tries += 1
@@ -92,6 +138,32 @@ class IdentitiesRegistry:
 
     async def future_find(self, pubkey, community):
         """
+        Find an identity.
+        Concurrent lookups of the same pubkey share the same requests,
+        and identities which were not found are not looked up again
+        before NOT_FOUND_TTL blocks.
+
+        :param pubkey: The pubkey we look for
+        :param community: The community where we look for the identity
+        :return: The identity found
+        :rtype: sakia.core.registry.Identity
+        """
+        identity = self._identities(community).get(pubkey)
+        if identity and (identity.local_state != LocalState.NOT_FOUND
+                         or self._known_not_found(pubkey, community)):
+            return identity
+
+        key = (community.currency, pubkey)
+        if key not in self._lookups:
+            lookup = asyncio.ensure_future(self._find(pubkey, community))
+            lookup.add_done_callback(lambda f: self._lookups.pop(key) if self._lookups.get(key) is f else None)
+            self._lookups[key] = lookup
+        # The lookup is shielded so that a cancelled caller does not cancel the other ones
+        return await asyncio.shield(self._lookups[key])
+
+    async def _find(self, pubkey, community):
+        """
+        Look up an identity on the network
 
         :param pubkey: The pubkey we look for
         :param community: The community where we look for the identity
@@ -103,29 +175,169 @@ class IdentitiesRegistry:
         else:
             identity = Identity.empty(pubkey)
             self._identities(community)[pubkey] = identity
-            tries = 0
-            while tries < 3 and identity.local_state == LocalState.NOT_FOUND:
-                try:
-                    data = await community.bma_access.simple_request(bma.blockchain.Membership,
-                                                                          req_args={'search': pubkey})
-                    identity.uid = data['uid']
-                    identity.sigdate = data['sigDate']
-                    identity.local_state = LocalState.PARTIAL
-                    identity.blockchain_state = BlockchainState.VALIDATED
-                except ValueError as e:
-                    if '404' in str(e) or '400' in str(e):
-                        identity = await self._find_by_lookup(pubkey, community)
-                        return identity
-                    else:
-                        tries += 1
-                except asyncio.TimeoutError:
-                    tries += 1
-                except ClientError:
-                    tries += 1
-                except NoPeerAvailable:
+        tries = 0
+        while tries < 3 and identity.local_state == LocalState.NOT_FOUND:
+            try:
+                data = await community.bma_access.simple_request(bma.blockchain.Membership,
+                                                                      req_args={'search': pubkey})
+                identity.uid = data['uid']
+                identity.sigdate = data['sigDate']
+                identity.local_state = LocalState.PARTIAL
+                identity.blockchain_state = BlockchainState.VALIDATED
+            except ValueError as e:
+                if '404' in str(e) or '400' in str(e):
+                    identity = await self._find_by_lookup(pubkey, community)
                     return identity
+                else:
+                    tries += 1
+            except asyncio.TimeoutError:
+                tries += 1
+            except ClientError:
+                tries += 1
+            except NoPeerAvailable:
+                return identity
         return identity
 
+    async def future_find_batch(self, pubkeys, community, concurrency=FIND_CONCURRENCY):
+        """
+        Find the identities of many pubkeys concurrently.
+        Each pubkey is looked up once, even if it is given many times.
+
+        :param list[str] pubkeys: The pubkeys we look for
+        :param sakia.core.Community community: The community where we look for the identities
+        :param int concurrency: The maximum number of simultaneous lookups
+        :return: The identities found, by pubkey
+        :rtype: dict[str, sakia.core.registry.Identity]
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded_find(pubkey):
+            with (await semaphore):
+                return await self.future_find(pubkey, community)
+
+        identities = {}
+        unknown = []
+        for pubkey in set(pubkeys):
+            # Identities already resolved do not need a coroutine
+            identity = self._identities(community).get(pubkey)
+            if identity and identity.local_state != LocalState.NOT_FOUND:
+                identities[pubkey] = identity
+            else:
+                unknown.append(pubkey)
+
+        if unknown:
+            found = await asyncio.gather(*[bounded_find(p) for p in unknown])
+            identities.update(zip(unknown, found))
+        return identities
+
+    def is_member(self, pubkey, community):
+        """
+        Check if a pubkey is a member of a community, from the members list of the registry
+
+        :param str pubkey: The pubkey
+        :param sakia.core.Community community: The community
+        :return: True if the pubkey is a member, or None if the members list was not refreshed yet
+        :rtype: bool
+        """
+        members = self._members.get(community.currency)
+        if members is None:
+            return None
+        return pubkey in members
+
+    async def refresh_members(self, community, block_number=None):
+        """
+        Load the identities of all the members of a community from the members list,
+        so that they are found without requesting the network.
+        Once the list is known, the members who joined or were excluded are read
+        in the new blocks. Leaving members stay members until they are excluded.
+        The whole list is requested again when too many blocks were mined,
+        or when the blockchain was rolled back.
+
+        :param sakia.core.Community community: The community
+        :param int block_number: The number of the new block
+        :return: True if identities were updated
+        :rtype: bool
+        """
+        try:
+            members_block = self._members_blocks.get(community.currency)
+            if block_number is not None and members_block is not None \
+                    and members_block.number < block_number <= members_block.number + MEMBERS_MAX_BLOCKS:
+                changed = await self._apply_members_blocks(community, members_block, block_number)
+                if changed is not None:
+                    return changed
+            return await self._request_members(community)
+        except ValueError as e:
+            logging.debug(str(e))
+            return False
+        except NoPeerAvailable as e:
+            logging.debug(str(e))
+            return False
+
+    async def _apply_members_blocks(self, community, members_block, block_number):
+        """
+        Update the members list from the joiners and the excluded members of new blocks
+
+        :param sakia.core.Community community: The community
+        :param ucoinpy.documents.BlockId members_block: The block of the members list
+        :param int block_number: The number of the new block
+        :return: True if identities were updated, or None if the blocks do not follow the members list
+        :rtype: bool
+        """
+        blocks = []
+        previous_hash = members_block.sha_hash
+        for number in range(members_block.number + 1, block_number + 1):
+            block = await community.bma_access.future_request(bma.blockchain.Block,
+                                                              req_args={'number': number})
+            if block['previousHash'] != previous_hash:
+                return None
+            previous_hash = block['hash']
+            blocks.append(block)
+
+        members = self._members[community.currency]
+        changed = False
+        for block in blocks:
+            block_doc = parse_block("{0}{1}\n".format(block['raw'], block['signature']))
+            for joiner in block_doc.joiners:
+                self.from_handled_data(joiner.uid, joiner.issuer, None, BlockchainState.VALIDATED, community)
+                members[joiner.issuer] = joiner.uid
+                changed = True
+            for pubkey in block_doc.excluded:
+                if members.pop(pubkey, None) is not None:
+                    changed = True
+        self._members_blocks[community.currency] = BlockId(block_number, previous_hash)
+        if changed:
+            # The next members list can not be compared to the previous one anymore
+            self._members_digests.pop(community.currency, None)
+        return changed
+
+    async def _request_members(self, community):
+        """
+        Request the whole members list.
+        Only the members who joined, left or changed their uid since the previous list are updated.
+
+        :param sakia.core.Community community: The community
+        :return: True if identities were updated
+        :rtype: bool
+        """
+        members_block = community.network.current_blockid
+        data = await community.bma_access.future_request(bma.wot.Members)
+        digest = community.bma_access.digest(bma.wot.Members)
+        self._members_blocks[community.currency] = members_block
+        if digest and digest == self._members_digests.get(community.currency):
+            return False
+
+        members = {m['pubkey']: m['uid'] for m in data['results']}
+        previous = self._members.get(community.currency, {})
+        changed = [pubkey for pubkey in members if previous.get(pubkey) != members[pubkey]]
+        for pubkey in changed:
+            self.from_handled_data(members[pubkey], pubkey, None, BlockchainState.VALIDATED, community)
+        left = previous.keys() - members.keys()
+        logging.debug("{0} members identities updated, {1} members left".format(len(changed), len(left)))
+
+        self._members[community.currency] = members
+        self._members_digests[community.currency] = digest
+        return len(changed) > 0 or len(left) > 0
+
     def from_handled_data(self, uid, pubkey, sigdate, blockchain_state, community):
         """
         Get a person from a metadata dict.
@@ -140,6 +352,7 @@ class IdentitiesRegistry:
         :rtype: sakia.core.registry.Identity
         """
         identities = self._identities(community)
+        self._not_found.get(community.currency, {}).pop(pubkey, None)
         if pubkey in identities:
             if identities[pubkey].blockchain_state == BlockchainState.NOT_FOUND:
                 identities[pubkey].blockchain_state = blockchain_state
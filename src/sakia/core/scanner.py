@@ -0,0 +1,165 @@
+import logging
+from collections import OrderedDict
+from ucoinpy.api import bma
+from ucoinpy.documents import Block
+from ..tools.documents import documents_cache
+
+MAX_BLOCKS = 256
+
+
+class ScannedBlock:
+    """
+    A parsed block, with its transactions indexed by the public keys
+    of their issuers and recipients
+    """
+    def __init__(self, block_hash, doc):
+        """
+        :param str block_hash: The hash of the block
+        :param ucoinpy.documents.Block doc: The block document
+        """
+        self.hash = block_hash
+        self.doc = doc
+        self._transactions = {}
+        for tx in doc.transactions:
+            pubkeys = set(tx.issuers) | set(o.pubkey for o in tx.outputs)
+            for pubkey in pubkeys:
+                self._transactions.setdefault(pubkey, []).append(tx)
+
+    def transactions(self, pubkey):
+        """
+        Get the transactions of the block issued by or sent to a public key
+
+        :param str pubkey: The public key
+        :return: The transactions, in the order of the block
+        :rtype: list[ucoinpy.documents.Transaction]
+        """
+        return self._transactions.get(pubkey, [])
+
+
+class BlockScanner:
+    """
+    Parses the blocks of a currency once for all the wallets of all the accounts.
+    The latest scanned blocks are kept, the least recently used are forgotten first.
+    Blocks which can not be rolled back anymore are kept in a local block store.
+    """
+    def __init__(self, store=None, max_blocks=MAX_BLOCKS, documents=None):
+        """
+        :param sakia.core.blockstore.BlockStore store: The local store of the blocks
+        :param int max_blocks: The maximum number of parsed blocks kept
+        :param sakia.tools.documents.DocumentsCache documents: The cache of the parsed documents,
+        the cache of the application by default
+        """
+        self._store = store
+        self._max_blocks = max_blocks
+        self._documents = documents if documents is not None else documents_cache
+        self._blocks = OrderedDict()
+
+    @property
+    def store(self):
+        return self._store
+
+    def _keep(self, number, scanned_block):
+        self._blocks[number] = scanned_block
+        self._blocks.move_to_end(number)
+        while len(self._blocks) > self._max_blocks:
+            self._blocks.popitem(last=False)
+
+    async def scan(self, community, number):
+        """
+        Get a parsed block.
+        Blocks which could still be rolled back are requested every time, through the cache
+        of the community, so that a block which was rolled back is parsed again.
+
+        :param sakia.core.Community community: The community
+        :param int number: The block number
+        :return: the parsed block, or None if it was not found
+        :rtype: ScannedBlock
+        """
+        immutable = number <= community.network.current_blockid.number - community.network.fork_window
+        if immutable:
+            scanned_block = self._blocks.get(number)
+            if scanned_block:
+                self._blocks.move_to_end(number)
+                return scanned_block
+            stored = self._store.block(number) if self._store else None
+            if stored:
+                scanned_block = ScannedBlock(stored[0], self._documents.parse(Block, stored[1]))
+                self._keep(number, scanned_block)
+                return scanned_block
+
+        tries = 0
+        block = None
+        while block is None and tries < 3:
+            try:
+                block = await community.bma_access.future_request(bma.blockchain.Block,
+                                                                  req_args={'number': number})
+            except ValueError as e:
+                logging.debug(str(e))
+                tries += 1
+        if block is None:
+            return None
+
+        # Concurrent scans of the same block find it here
+        # once the first one parsed it
+        scanned_block = self._blocks.get(number)
+        if scanned_block and scanned_block.hash == block['hash']:
+            self._blocks.move_to_end(number)
+            return scanned_block
+
+        signed_raw = "{0}{1}\n".format(block['raw'], block['signature'])
+        try:
+            scanned_block = ScannedBlock(block['hash'], self._documents.parse(Block, signed_raw))
+        except TypeError:
+            logging.debug("Error in {0}".format(number))
+            return None
+
+        self._keep(number, scanned_block)
+        if immutable and self._store:
+            self._store.add(block['hash'], signed_raw, scanned_block.doc)
+        return scanned_block
+
+    async def header(self, community, number):
+        """
+        Get the header of a block.
+        The header of a stored block is read locally, the other ones are requested.
+
+        :param sakia.core.Community community: The community
+        :param int number: The block number
+        :return: The header, with the keys of a bma block
+        :rtype: dict
+        """
+        header = self._store.header(number) if self._store else None
+        if header is None:
+            header = await community.bma_access.future_request(bma.blockchain.Block,
+                                                               req_args={'number': number})
+        return header
+
+    def commit(self):
+        """
+        Write the blocks stored by the previous scans
+        """
+        if self._store:
+            self._store.commit()
+
+    def stored_blocks_without_transactions(self, pubkey, from_number, to_number):
+        """
+        Get the numbers of the stored blocks without transactions of a public key.
+        These blocks do not need to be parsed for this public key.
+
+        :param str pubkey: The public key
+        :param int from_number: The number of the first block
+        :param int to_number: The number of the last block
+        :rtype: set[int]
+        """
+        if not self._store:
+            return set()
+        return set(self._store.numbers(from_number, to_number)) \
+            - set(self._store.transactions_blocks(pubkey, from_number, to_number))
+
+    def close(self):
+        """
+        Close the block store
+        """
+        if self._store:
+            self._store.close()
+            self._store = None
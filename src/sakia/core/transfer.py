@@ -7,6 +7,7 @@ import logging
 import time
 from ucoinpy.api import bma
 from ucoinpy.documents import Block, BlockId
+from ..tools.documents import parse_block
 from PyQt5.QtCore import pyqtSignal, QObject
 from enum import Enum
 
@@ -35,6 +36,7 @@ class Transfer(QObject):
     """
     transfer_broadcasted = pyqtSignal(str)
     broadcast_error = pyqtSignal(int, str)
+    blockid_changed = pyqtSignal(object)
 
     def __init__(self, sha_hash, state, blockid, metadata, locally_created):
         """
@@ -64,7 +66,7 @@ class Transfer(QObject):
 
         self.sha_hash = sha_hash
         self.state = state
-        self.blockid = blockid
+        self._blockid = blockid
         self._locally_created = locally_created
         self._metadata = metadata
 
@@ -142,9 +144,29 @@ class Transfer(QObject):
         return {'hash': self.sha_hash,
                 'state': self.state.name,
                 'blockid': str(self.blockid) if self.blockid else None,
-                'metadata': self._metadata,
+                'metadata': dict(self._metadata),
                 'local': self._locally_created}
 
+    @property
+    def blockid(self):
+        """
+        :return: The blockid of the transaction in the blockchain
+        :rtype: ucoinpy.documents.BlockId
+        """
+        return self._blockid
+
+    @blockid.setter
+    def blockid(self, blockid):
+        """
+        Set the blockid of the transaction.
+        Emits blockid_changed with the previous blockid.
+
+        :param ucoinpy.documents.BlockId blockid: The new blockid
+        """
+        previous = self._blockid
+        self._blockid = blockid
+        self.blockid_changed.emit(previous)
+
     @property
     def metadata(self):
         """
@@ -346,7 +368,7 @@ class Transfer(QObject):
         block = await community.bma_access.future_request(bma.blockchain.Block,
                                   req_args={'number': blockid.number})
         signed_raw = "{0}{1}\n".format(block['raw'], block['signature'])
-        block_doc = Block.from_signed_raw(signed_raw)
+        block_doc = parse_block(signed_raw)
         result = (False, "")
         for r in responses:
             if r.status == 200:
@@ -365,7 +387,7 @@ class Transfer(QObject):
         """
         block = await community.get_block(self.blockid.number)
         if block:
-            block_doc = Block.from_signed_raw("{0}{1}\n".format(block['raw'], block['signature']))
+            block_doc = parse_block("{0}{1}\n".format(block['raw'], block['signature']))
             for tx in block_doc.transactions:
                 if tx.sha_hash == self.sha_hash:
                     return tx
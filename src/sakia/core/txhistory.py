@@ -1,12 +1,73 @@
 import asyncio
+import bisect
 import logging
 import hashlib
+from collections import deque
 from ucoinpy.documents.transaction import InputSource
-from ucoinpy.documents.block import Block
 from ucoinpy.api import  bma
 from .transfer import Transfer, TransferState
 from .net.network import MAX_CONFIRMATIONS
-from ..tools.exceptions import LookupFailureError, NoPeerAvailable
+from ..tools.exceptions import NoPeerAvailable
+from ..tools.documents import parse_block
+
+PREFETCH_WINDOW = 32
+PREFETCH_CONCURRENCY = 8
+SOURCES_RECONCILIATION = 50
+MAX_INCREMENTAL_DIVIDENDS = 3
+
+
+class BlocksPrefetch:
+    """
+    Requests blocks ahead of their parsing.
+    The blocks are requested concurrently, but they are returned in order.
+    """
+    def __init__(self, fetch, numbers, window=PREFETCH_WINDOW, concurrency=PREFETCH_CONCURRENCY):
+        """
+        :param fetch: The coroutine function fetching a block from its number
+        :param list[int] numbers: The numbers of the blocks, in parsing order
+        :param int window: The maximum number of blocks requested ahead
+        :param int concurrency: The maximum number of simultaneous requests
+        """
+        self._fetch = fetch
+        self._numbers = iter(numbers)
+        self._window = window
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending = deque()
+        self._fill()
+
+    async def _bounded_fetch(self, number):
+        with (await self._semaphore):
+            return await self._fetch(number)
+
+    def _fill(self):
+        while len(self._pending) < self._window:
+            number = next(self._numbers, None)
+            if number is None:
+                break
+            self._pending.append((number, asyncio.ensure_future(self._bounded_fetch(number))))
+
+    async def next(self):
+        """
+        Get the next block
+
+        :return: the block number and the fetched block
+        :rtype: tuple
+        """
+        number, future = self._pending.popleft()
+        self._fill()
+        return number, await future
+
+    def cancel(self):
+        """
+        Cancel the requests of the blocks which were not returned yet
+        """
+        for number, future in self._pending:
+            if future.done():
+                if not future.cancelled():
+                    future.exception()
+            else:
+                future.cancel()
+        self._pending.clear()
 
 
 class TxHistory():
@@ -17,51 +78,105 @@ class TxHistory():
         self._stop_coroutines = False
         self._running_refresh = []
         self._transfers = []
-        self.available_sources = []
+        self._transfers_by_hash = {}
+        self._unhashed_transfers = []
+        self._transfers_by_block = {}
+        self._parsed_blocks = {}
+        self._sources = []
+        self._sources_amounts = []
+        self._sources_block = 0
+        self._sources_reconciliation = None
+        self._reservations = {}
         self._dividends = []
+        self._dividends_by_block = {}
+        self._member = None
 
     @property
     def latest_block(self):
         return self._latest_block
 
+    @property
+    def available_sources(self):
+        """
+        :return: The available sources, sorted by amount
+        :rtype: list[ucoinpy.documents.transaction.InputSource]
+        """
+        return self._sources
+
+    @available_sources.setter
+    def available_sources(self, sources):
+        self._sources = sorted(sources, key=lambda s: s.amount)
+        self._sources_amounts = [s.amount for s in self._sources]
+
+    def _add_source(self, source):
+        """
+        Add an available source, keeping the sources sorted by amount
+
+        :param ucoinpy.documents.transaction.InputSource source: The source
+        """
+        position = bisect.bisect_right(self._sources_amounts, source.amount)
+        self._sources.insert(position, source)
+        self._sources_amounts.insert(position, source.amount)
+
     @latest_block.setter
     def latest_block(self, value):
         self._latest_block = value
 
     def load_from_json(self, data):
         self._transfers = []
+        self._transfers_by_hash = {}
+        self._unhashed_transfers = []
+        self._transfers_by_block = {}
+        self._reservations = {}
 
-        data_sent = data['transfers']
-        for s in data_sent:
-            self._transfers.append(Transfer.load(s))
+        transfers = [Transfer.load(s) for s in data['transfers']]
+        for transfer in transfers:
+            self._add_transfer(transfer)
+        for r in data.get('reservations', []):
+            self._reservations[transfers[r['transfer']]] = set(tuple(k) for k in r['sources'])
 
-        for s in data['sources']:
-            self.available_sources.append(InputSource.from_inline(s['inline']))
+        self.available_sources = [InputSource.from_inline(s['inline']) for s in data['sources']]
+        self._sources_block = data.get('sources_block', 0)
+        self._member = data.get('member', None)
 
         for d in data['dividends']:
             d['state'] = TransferState[d['state']]
-            self._dividends.append(d)
+            self._add_dividend(d)
 
         self.latest_block = data['latest_block']
 
     def jsonify(self):
         data_transfer = []
+        transfers_index = {}
         for s in self.transfers:
+            transfers_index[s] = len(data_transfer)
             data_transfer.append(s.jsonify())
 
+        # The reservations refer to the transfers by their index in the saved list
+        self._release_sources()
+        data_reservations = []
+        for transfer, keys in self._reservations.items():
+            if transfer in transfers_index:
+                data_reservations.append({'transfer': transfers_index[transfer],
+                                          'sources': [list(k) for k in keys]})
+
         data_sources = []
         for s in self.available_sources:
             s.index = 0
             data_sources.append({'inline': "{0}\n".format(s.inline())})
 
         data_dividends = []
-        for d in self._dividends.copy():
-            d['state'] = d['state'].name
-            data_dividends.append(d)
+        for d in self._dividends:
+            data_dividend = d.copy()
+            data_dividend['state'] = d['state'].name
+            data_dividends.append(data_dividend)
 
         return {'latest_block': self.latest_block,
                 'transfers': data_transfer,
                 'sources': data_sources,
+                'sources_block': self._sources_block,
+                'reservations': data_reservations,
+                'member': self._member,
                 'dividends': data_dividends}
 
     @property
@@ -72,6 +187,174 @@ class TxHistory():
     def dividends(self):
         return self._dividends.copy()
 
+    def _index_block(self, transfer, previous_blockid=None):
+        """
+        Move a transfer in the index of the blocks when its blockid changes
+
+        :param sakia.core.Transfer transfer: The transfer
+        :param ucoinpy.documents.BlockId previous_blockid: The previous blockid of the transfer
+        """
+        if previous_blockid is not None:
+            block_transfers = self._transfers_by_block.get(previous_blockid.number, [])
+            if transfer in block_transfers:
+                block_transfers.remove(transfer)
+                if not block_transfers:
+                    self._transfers_by_block.pop(previous_blockid.number)
+        if transfer.blockid is not None:
+            self._transfers_by_block.setdefault(transfer.blockid.number, []).append(transfer)
+
+    def _add_transfer(self, transfer):
+        """
+        Add a transfer to the history and to its indexes
+
+        :param sakia.core.Transfer transfer: The transfer
+        """
+        self._transfers.append(transfer)
+        if transfer.sha_hash:
+            self._transfers_by_hash[transfer.sha_hash] = transfer
+        else:
+            # The hash of a transfer is known once it is sent
+            self._unhashed_transfers.append(transfer)
+        self._index_block(transfer)
+        transfer.blockid_changed.connect(lambda previous: self._index_block(transfer, previous))
+
+    def add_transfer(self, transfer):
+        """
+        Add a transfer created locally
+
+        :param sakia.core.Transfer transfer: The transfer
+        """
+        self._add_transfer(transfer)
+
+    def transfer(self, sha_hash):
+        """
+        Get a known transfer from the hash of its transaction
+
+        :param str sha_hash: The hash of the transaction
+        :return: The transfer, or None if it is not known
+        :rtype: sakia.core.Transfer
+        """
+        if self._unhashed_transfers:
+            for transfer in [t for t in self._unhashed_transfers if t.sha_hash]:
+                self._transfers_by_hash[transfer.sha_hash] = transfer
+                self._unhashed_transfers.remove(transfer)
+        return self._transfers_by_hash.get(sha_hash)
+
+    def _add_dividend(self, dividend):
+        """
+        Add a dividend to the history and to its index
+
+        :param dict dividend: The dividend
+        """
+        self._dividends.append(dividend)
+        self._dividends_by_block[dividend['block_number']] = dividend
+
+    def _remove_dividend(self, dividend):
+        """
+        Remove a dividend from the history and from its index
+
+        :param dict dividend: The dividend
+        """
+        self._dividends.remove(dividend)
+        self._dividends_by_block.pop(dividend['block_number'])
+
+    @property
+    def sources_synced(self):
+        """
+        :return: True if the available sources are known locally
+        :rtype: bool
+        """
+        return self._sources_block > 0
+
+    @staticmethod
+    def _source_key(source):
+        return source.source, source.number, source.txhash, source.amount
+
+    def reserve_sources(self, transfer, sources):
+        """
+        Reserve the sources spent by an outgoing transfer,
+        so that the next transfers do not spend them again before it is validated.
+        The sources are released when the transfer is refused, dropped or validated.
+
+        :param sakia.core.Transfer transfer: The outgoing transfer
+        :param list[ucoinpy.documents.transaction.InputSource] sources: The sources spent by the transfer
+        """
+        self._reservations[transfer] = set(TxHistory._source_key(s) for s in sources)
+
+    def _release_sources(self):
+        """
+        Release the sources of the transfers which do not spend them anymore.
+        The sources of a validated transfer are removed from the available sources
+        by the block of its transaction.
+        """
+        for transfer in [t for t in self._reservations
+                         if t.state not in (TransferState.TO_SEND, TransferState.AWAITING,
+                                            TransferState.VALIDATING)]:
+            self._reservations.pop(transfer)
+
+    @property
+    def spendable_sources(self):
+        """
+        :return: The available sources which are not reserved by an outgoing transfer, sorted by amount
+        :rtype: list[ucoinpy.documents.transaction.InputSource]
+        """
+        self._release_sources()
+        if not self._reservations:
+            return list(self.available_sources)
+        reserved = set.union(*self._reservations.values())
+        return [s for s in self.available_sources if TxHistory._source_key(s) not in reserved]
+
+    def _apply_transaction(self, tx, block_number):
+        """
+        Update the available sources with a transaction of the wallet:
+        the inputs it consumed are removed, and its outputs to the wallet are added.
+        The transactions of the blocks already applied are ignored.
+
+        :param ucoinpy.documents.Transaction tx: The transaction
+        :param int block_number: The number of the block of the transaction
+        """
+        if block_number <= self._sources_block:
+            return
+        consumed = set(TxHistory._source_key(i) for i in tx.inputs
+                       if tx.issuers[i.index] == self.wallet.pubkey)
+        if consumed:
+            self.available_sources = [s for s in self.available_sources
+                                      if TxHistory._source_key(s) not in consumed]
+        for o in tx.outputs:
+            if o.pubkey == self.wallet.pubkey:
+                self._add_source(InputSource(None, 'T', block_number, tx.sha_hash, o.amount))
+
+    def _apply_dividend(self, block_number, block_hash, amount):
+        """
+        Add the source of a dividend to the available sources.
+        The dividends of the blocks already applied are ignored.
+
+        :param int block_number: The number of the block of the dividend
+        :param str block_hash: The hash of the block of the dividend
+        :param int amount: The amount of the dividend
+        """
+        if block_number <= self._sources_block:
+            return
+        self._add_source(InputSource(None, 'D', block_number, block_hash, amount))
+
+    async def _reconcile_sources(self, community, block_number):
+        """
+        Replace the available sources by the sources known by the network.
+        If the sources can not be requested, the current sources are kept
+        and the reconciliation is tried again on the next refresh.
+
+        :param sakia.core.Community community: The community
+        :param int block_number: The number of the current block
+        """
+        logging.debug("Reconcile sources at {0}".format(block_number))
+        try:
+            self.available_sources = await self.wallet.request_sources(community)
+        except NoPeerAvailable as e:
+            logging.debug(str(e))
+            return
+        self._sources_block = block_number
+        self._sources_reconciliation = block_number
+
     def stop_coroutines(self):
         self._stop_coroutines = True
 
@@ -82,31 +365,16 @@ class TxHistory():
         :param int number: The block number to retrieve
         :return: the block doc or None if no block was found
         """
-        tries = 0
-        block_doc = None
-        block = None
-        while block is None and tries < 3:
-            try:
-                block = await community.bma_access.future_request(bma.blockchain.Block,
-                                      req_args={'number': number})
-                signed_raw = "{0}{1}\n".format(block['raw'],
-                                           block['signature'])
-                try:
-                    block_doc = Block.from_signed_raw(signed_raw)
-                except TypeError:
-                    logging.debug("Error in {0}".format(number))
-                    block = None
-                    tries += 1
-            except ValueError as e:
-                if '404' in str(e):
-                    block = None
-                    tries += 1
-        return block_doc
+        scanned_block = await self.app.block_scanner(community).scan(community, number)
+        if scanned_block:
+            return scanned_block.doc
+        return None
 
     async def _parse_transaction(self, community, tx, blockid,
                            mediantime, received_list, txid):
         """
         Parse a transaction
+        The uids of the issuer and of the receiver are resolved later, with the other transactions
         :param sakia.core.Community community: The community
         :param ucoinpy.documents.Transaction tx: The tx json data
         :param ucoinpy.documents.BlockId blockid: The block id where we found the tx
@@ -121,25 +389,13 @@ class TxHistory():
         if len(receivers) == 0:
             receivers = [tx.issuers[0]]
 
-        try:
-            issuer = await self.wallet._identities_registry.future_find(tx.issuers[0], community)
-            issuer_uid = issuer.uid
-        except LookupFailureError:
-            issuer_uid = ""
-
-        try:
-            receiver = await self.wallet._identities_registry.future_find(receivers[0], community)
-            receiver_uid = receiver.uid
-        except LookupFailureError:
-            receiver_uid = ""
-
         metadata = {
                     'time': mediantime,
                     'comment': tx.comment,
                     'issuer': tx.issuers[0],
-                    'issuer_uid': issuer_uid,
+                    'issuer_uid': "",
                     'receiver': receivers[0],
-                    'receiver_uid': receiver_uid,
+                    'receiver_uid': "",
                     'txid': txid
                     }
 
@@ -180,24 +436,31 @@ class TxHistory():
             return transfer
         return None
 
-    async def _parse_block(self, community, block_number, received_list, txmax):
+    async def _parse_block(self, community, block_number, scanned_block, received_list, txmax):
         """
         Parse a block
         :param sakia.core.Community community: The community
-        :param int block_number: The block to request
+        :param int block_number: The block number
+        :param sakia.core.scanner.ScannedBlock scanned_block: The parsed block, or None if it was not found
         :param list received_list: The list where we are appending transactions
         :param int txmax: Latest tx id
         :return: The list of transfers sent
         """
-        block_doc = await self._get_block_doc(community, block_number)
         transfers = []
-        if block_doc:
+        if scanned_block:
+            block_doc = scanned_block.doc
             for transfer in [t for t in self._transfers if t.state == TransferState.AWAITING]:
                 transfer.run_state_transitions((False, block_doc))
 
-            new_tx = [t for t in block_doc.transactions
-                      if t.sha_hash not in [trans.sha_hash for trans in self._transfers]
-                      ]
+            # The hashes of the parsed blocks are used to find the fork point of a rollback
+            self._parsed_blocks[block_number] = scanned_block.hash
+
+            for tx in scanned_block.transactions(self.wallet.pubkey):
+                self._apply_transaction(tx, block_number)
+
+            # Only the transactions of this wallet are parsed
+            new_tx = [t for t in scanned_block.transactions(self.wallet.pubkey)
+                      if self.transfer(t.sha_hash) is None]
 
             for (txid, tx) in enumerate(new_tx):
                 transfer = await self._parse_transaction(community, tx, block_doc.blockid,
@@ -212,22 +475,83 @@ class TxHistory():
             logging.debug("Could not find or parse block {0}".format(block_number))
         return transfers
 
+    async def _resolve_identities(self, community, transfers):
+        """
+        Fill the uids of the issuers and receivers of parsed transfers.
+        All the identities are looked up together.
+
+        :param sakia.core.Community community: The community
+        :param list[sakia.core.Transfer] transfers: The parsed transfers
+        """
+        pubkeys = [t.metadata['issuer'] for t in transfers] + [t.metadata['receiver'] for t in transfers]
+        identities = await self.wallet._identities_registry.future_find_batch(pubkeys, community)
+        for transfer in transfers:
+            transfer.metadata['issuer_uid'] = identities[transfer.metadata['issuer']].uid
+            transfer.metadata['receiver_uid'] = identities[transfer.metadata['receiver']].uid
+
     async def request_dividends(self, community, parsed_block):
+        """
+        Get the dividends of the wallet from a block.
+        The whole dividends history of the wallet is requested by the first refresh,
+        when the membership of the wallet changed since the previous request
+        or is not known by the identities registry yet,
+        or when too many dividends were created since the block.
+        Otherwise the dividends are looked for in the blocks with a dividend since the block,
+        which are received by the wallet if it is a member.
+
+        :param sakia.core.Community community: The community
+        :param int parsed_block: The number of the first block
+        :return: The dividends
+        :rtype: list[dict]
+        """
+        is_member = self.wallet._identities_registry.is_member(self.wallet.pubkey, community)
+        # The current membership only applies to the blocks since the previous request
+        if self.latest_block == 0 or is_member is None or self._member != is_member:
+            dividends = await self._request_dividends_history(community, parsed_block)
+            if is_member is not None:
+                self._member = is_member
+            return dividends
+
+        with_ud_data = await community.bma_access.future_request(bma.blockchain.UD)
+        blocks_with_ud = [n for n in with_ud_data['result']['blocks'] if n >= parsed_block]
+        new_blocks = [n for n in blocks_with_ud if n not in self._dividends_by_block]
+        if len(new_blocks) > MAX_INCREMENTAL_DIVIDENDS:
+            return await self._request_dividends_history(community, parsed_block)
+
+        scanner = self.app.block_scanner(community)
+        dividends = []
+        for block_number in blocks_with_ud:
+            if block_number in self._dividends_by_block:
+                dividends.append(dict(self._dividends_by_block[block_number]))
+            elif is_member:
+                header = await scanner.header(community, block_number)
+                dividends.append({'block_number': block_number,
+                                  'consumed': False,
+                                  'time': header['medianTime'],
+                                  'amount': header['dividend']})
+        return dividends
+
+    async def _request_dividends_history(self, community, parsed_block):
+        """
+        Get the dividends of the wallet from a block, in its whole dividends history
+
+        :param sakia.core.Community community: The community
+        :param int parsed_block: The number of the first block
+        :return: The dividends
+        :rtype: list[dict]
+        """
         for i in range(0, 6):
             try:
                 dividends_data = await community.bma_access.future_request(bma.ud.History,
                                                 req_args={'pubkey': self.wallet.pubkey})
 
-                dividends = dividends_data['history']['history'].copy()
-
-                for d in dividends:
-                    if d['block_number'] < parsed_block:
-                        dividends.remove(d)
-                return dividends
+                # The dividends are copied as they are modified by the history
+                return [dict(d) for d in dividends_data['history']['history']
+                        if d['block_number'] >= parsed_block]
             except ValueError as e:
                 if '404' in str(e):
                     pass
-        return {}
+        return []
 
     async def _refresh(self, community, block_number_from, block_to, received_list):
         """
@@ -238,49 +562,100 @@ class TxHistory():
         """
         new_transfers = []
         new_dividends = []
+        prefetch = None
         try:
             logging.debug("Refresh from : {0} to {1}".format(block_number_from, block_to['number']))
+            # The sources are maintained from the parsed blocks,
+            # and regularly replaced by the sources known by the network
+            if self._sources_reconciliation is None \
+                    or block_to['number'] >= self._sources_reconciliation + SOURCES_RECONCILIATION:
+                await self._reconcile_sources(community, block_to['number'])
+                if self._stop_coroutines:
+                    return
             dividends = await self.request_dividends(community, block_number_from)
             with_tx_data = await community.bma_access.future_request(bma.blockchain.TX)
             blocks_with_tx = with_tx_data['result']['blocks']
-            while block_number_from <= block_to['number']:
-                udid = 0
-                for d in [ud for ud in dividends if ud['block_number'] == block_number_from]:
-                    state = TransferState.VALIDATED if block_number_from + MAX_CONFIRMATIONS <= block_to['number'] \
-                        else TransferState.VALIDATING
-
-                    if d['block_number'] not in [ud['block_number'] for ud in self._dividends]:
-                        d['id'] = udid
-                        d['state'] = state
-                        new_dividends.append(d)
+            dividends_by_block = {}
+            for d in dividends:
+                dividends_by_block.setdefault(d['block_number'], []).append(d)
+            blocks_with_ud = sorted(dividends_by_block.keys())
+
+            # The stored blocks are indexed by public key, so only the ones
+            # with transactions of the wallet are parsed
+            scanner = self.app.block_scanner(community)
+            skipped = scanner.stored_blocks_without_transactions(self.wallet.pubkey,
+                                                                 block_number_from, block_to['number'])
+            blocks_with_tx = [n for n in blocks_with_tx[bisect.bisect_left(blocks_with_tx, block_number_from):
+                                                        bisect.bisect_right(blocks_with_tx, block_to['number'])]
+                              if n not in skipped]
+
+            # We only walk the blocks with transactions or dividends,
+            # with cursors on their sorted lists
+            tx_cursor = 0
+            tx_end = len(blocks_with_tx)
+            ud_cursor = bisect.bisect_left(blocks_with_ud, block_number_from)
+            ud_end = bisect.bisect_right(blocks_with_ud, block_to['number'])
+            nb_blocks = tx_end - tx_cursor + ud_end - ud_cursor
+            parsed_blocks = 0
+            prefetch = BlocksPrefetch(lambda n: scanner.scan(community, n),
+                                      blocks_with_tx[tx_cursor:tx_end])
+            while tx_cursor < tx_end or ud_cursor < ud_end:
+                next_tx = blocks_with_tx[tx_cursor] if tx_cursor < tx_end else None
+                next_ud = blocks_with_ud[ud_cursor] if ud_cursor < ud_end else None
+                block_number = min(n for n in (next_tx, next_ud) if n is not None)
 
-                        udid += 1
-                    else:
-                        known_dividend = [ud for ud in self._dividends
-                                          if ud['block_number'] == d['block_number']][0]
-                        known_dividend['state'] = state
+                udid = 0
+                if block_number == next_ud:
+                    for d in dividends_by_block[block_number]:
+                        state = TransferState.VALIDATED if block_number + MAX_CONFIRMATIONS <= block_to['number'] \
+                            else TransferState.VALIDATING
+
+                        known_dividend = self._dividends_by_block.get(d['block_number'])
+                        if known_dividend is None:
+                            d['id'] = udid
+                            d['state'] = state
+                            new_dividends.append(d)
+
+                            udid += 1
+                        else:
+                            known_dividend['state'] = state
+                    if block_number > self._sources_block:
+                        header = await scanner.header(community, block_number)
+                        for d in dividends_by_block[block_number]:
+                            self._apply_dividend(block_number, header['hash'], d['amount'])
+                    ud_cursor += 1
+                    parsed_blocks += 1
 
                 # We parse only blocks with transactions
-                if block_number_from in blocks_with_tx:
-                    transfers = await self._parse_block(community, block_number_from,
+                if block_number == next_tx:
+                    number, scanned_block = await prefetch.next()
+                    transfers = await self._parse_block(community, number, scanned_block,
                                                              received_list,
                                                              udid + len(new_transfers))
                     new_transfers += transfers
+                    tx_cursor += 1
+                    parsed_blocks += 1
+
+                self._sources_block = max(self._sources_block, block_number)
 
-                self.wallet.refresh_progressed.emit(block_number_from, block_to['number'], self.wallet.pubkey)
-                block_number_from += 1
+                self.wallet.refresh_progressed.emit(parsed_blocks, nb_blocks, self.wallet.pubkey)
+            block_number_from = block_to['number'] + 1
+            await self._resolve_identities(community, new_transfers)
 
             signed_raw = "{0}{1}\n".format(block_to['raw'],
                                        block_to['signature'])
-            block_to = Block.from_signed_raw(signed_raw)
+            block_to = parse_block(signed_raw)
+            # Only the blocks of the fork window can be rolled back
+            for block_number in [n for n in self._parsed_blocks
+                                 if n < block_to.number - community.network.fork_window]:
+                self._parsed_blocks.pop(block_number)
             for transfer in [t for t in self._transfers + new_transfers if t.state == TransferState.VALIDATING]:
                 transfer.run_state_transitions((False, block_to, MAX_CONFIRMATIONS))
 
+            self._sources_block = max(self._sources_block, block_to.number)
+
             # We check if latest parsed block_number is a new high number
             if block_number_from > self.latest_block:
-                self.available_sources = await self.wallet.sources(community)
-                if self._stop_coroutines:
-                    return
                 self.latest_block = block_number_from
 
             parameters = await community.parameters()
@@ -291,9 +666,16 @@ class TxHistory():
             logging.debug(str(e))
             self.wallet.refresh_finished.emit([])
             return
+        finally:
+            if prefetch:
+                prefetch.cancel()
+            # The blocks stored by the scans of the refresh are written together
+            self.app.block_scanner(community).commit()
 
-        self._transfers = self._transfers + new_transfers
-        self._dividends = self._dividends + new_dividends
+        for transfer in new_transfers:
+            self._add_transfer(transfer)
+        for dividend in new_dividends:
+            self._add_dividend(dividend)
 
         self.wallet.refresh_finished.emit(received_list)
 
@@ -306,36 +688,77 @@ class TxHistory():
         block_doc = await self._get_block_doc(community, block_number)
 
         # We check if transactions are still present
-        for transfer in [t for t in self._transfers
-                         if t.state in (TransferState.VALIDATING, TransferState.VALIDATED) and
-                         t.blockid.number == block_number]:
-            if transfer.blockid.sha_hash == block_doc.blockid.sha_hash:
+        # The transitions move the transfers out of the block, so we iterate over a copy
+        for transfer in [t for t in self._transfers_by_block.get(block_number, [])
+                         if t.state in (TransferState.VALIDATING, TransferState.VALIDATED)]:
+            if block_doc and transfer.blockid.sha_hash == block_doc.blockid.sha_hash:
                 return True
             transfer.run_state_transitions((True, block_doc))
         return False
 
+    async def _fork_point(self, community, known_blocks):
+        """
+        Find the first known block which is not in the main blockchain anymore.
+        The blocks before the fork point are still in the main blockchain
+        and the blocks after it were all rolled back, so the fork point is found
+        with a binary search, fetching only a few blocks.
+
+        :param sakia.core.Community community: The community
+        :param list[tuple[int, str]] known_blocks: The number and the hash of the known blocks, sorted by number
+        :return: The index of the first block rolled back, or the number of known blocks if none was
+        :rtype: int
+        """
+        low = 0
+        high = len(known_blocks)
+        steps = len(known_blocks).bit_length()
+        step = 0
+        while low < high:
+            self.wallet.refresh_progressed.emit(step, steps, self.wallet.pubkey)
+            middle = (low + high) // 2
+            number, block_hash = known_blocks[middle]
+            block_doc = await self._get_block_doc(community, number)
+            if block_doc and block_doc.blockid.sha_hash == block_hash:
+                low = middle + 1
+            else:
+                high = middle
+            step += 1
+        return low
+
     async def _rollback(self, community):
         """
-        Rollback last transactions until we find one still present
-        in the main blockchain
+        Rollback the transactions and dividends of the blocks
+        which are not in the main blockchain anymore
 
         :param sakia.core.Community community: The community
         """
         try:
             logging.debug("Rollback from : {0}".format(self.latest_block))
-            # We look for the block goal to check for rollback,
-            #  depending on validating and validated transfers...
-            tx_blocks = [tx.blockid.number for tx in self._transfers
-                          if tx.state in (TransferState.VALIDATED, TransferState.VALIDATING) and
-                          tx.blockid is not None]
-            tx_blocks.reverse()
-            for i, block_number in enumerate(tx_blocks):
-                self.wallet.refresh_progressed.emit(i, len(tx_blocks), self.wallet.pubkey)
-                if (await self._check_block(community, block_number)):
-                    break
+            # Only the blocks of the fork window can be rolled back
+            head_number = max(self.latest_block, community.network.current_blockid.number)
+            window_start = max(0, head_number - community.network.fork_window)
+            # Only the hashes seen by this history are compared : the blocks scanned
+            # for other wallets could already be the blocks of the new branch
+            known_hashes = dict((n, h) for n, h in self._parsed_blocks.items() if n >= window_start)
+            for block_number in [n for n in self._transfers_by_block if n >= window_start]:
+                known_hashes[block_number] = self._transfers_by_block[block_number][0].blockid.sha_hash
+            known_blocks = sorted(known_hashes.items())
+
+            fork_index = await self._fork_point(community, known_blocks)
+            if fork_index < len(known_blocks):
+                fork_number = known_blocks[fork_index][0]
+                logging.debug("Fork point : {0}".format(fork_number))
+                for block_number in sorted(n for n in self._transfers_by_block if n >= fork_number):
+                    await self._check_block(community, block_number)
+                # The dividends of the rolled back blocks are found again by the next refresh
+                for dividend in [d for d in self._dividends if d['block_number'] >= fork_number]:
+                    self._remove_dividend(dividend)
+                self.latest_block = min(self.latest_block, fork_number)
+                for block_number in [n for n in self._parsed_blocks if n >= fork_number]:
+                    self._parsed_blocks.pop(block_number)
+                # The sources of the rolled back blocks are requested again
+                self._sources_reconciliation = None
 
             current_block = await self._get_block_doc(community, community.network.current_blockid.number)
-            members_pubkeys = await community.members_pubkeys()
             for transfer in [t for t in self._transfers
                              if t.state == TransferState.VALIDATED]:
                 transfer.run_state_transitions((True, current_block, MAX_CONFIRMATIONS))
@@ -349,7 +772,6 @@ class TxHistory():
             if current_block_number:
                 current_block = await community.bma_access.future_request(bma.blockchain.Block,
                                         req_args={'number': current_block_number})
-                members_pubkeys = await community.members_pubkeys()
                 # We look for the first block to parse, depending on awaiting and validating transfers and ud...
                 tx_blocks = [tx.blockid.number for tx in self._transfers
                           if tx.state in (TransferState.AWAITING, TransferState.VALIDATING) \
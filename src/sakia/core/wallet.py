@@ -18,6 +18,22 @@ from PyQt5.QtCore import QObject, pyqtSignal, QCoreApplication
 
 import logging
 import asyncio
+import bisect
+from enum import Enum
+
+MAX_INPUTS = 40
+
+
+class CoinSelection(Enum):
+    """
+    The strategies selecting the sources spent by a transaction
+    """
+    # As few inputs as possible, the smallest source covering the amount if there is one
+    FEWEST_INPUTS = 1
+    # A single source of the exact amount if there is one, else as few inputs as possible
+    EXACT_MATCH = 2
+    # The smallest sources first, to merge the small dividends, within MAX_INPUTS inputs
+    CONSOLIDATE = 3
 
 
 class Wallet(QObject):
@@ -151,41 +167,98 @@ class Wallet(QObject):
 
     async def value(self, community):
         """
-        Get wallet absolute value
+        Get wallet absolute value.
+        The value is computed from the sources maintained by the history of the wallet
+        once they are known, so that it does not wait for the network.
 
         :param community: The community to get value
         :return: The wallet absolute value
         """
         value = 0
-        sources = await self.sources(community)
+        cache = self.caches.get(community.currency)
+        if cache and cache.sources_synced:
+            sources = cache.available_sources
+        else:
+            sources = await self.sources(community)
         for s in sources:
             value += s.amount
         return value
 
-    def tx_inputs(self, amount, community):
+    @staticmethod
+    def _fewest_inputs(sources, amounts, amount):
         """
-        Get inputs to generate a transaction with a given amount of money
+        Select as few sources as possible.
+        The largest sources are taken until a single remaining source covers
+        the missing amount, then the smallest of these sources is taken.
 
+        :param list sources: The sources, sorted by amount
+        :param list[int] amounts: The amounts of the sources
         :param int amount: The amount target value
-        :param community: The community target of the transaction
-
-        :return: The list of inputs to use in the transaction document
+        :return: The selected sources, or None if they do not cover the amount
         """
+        inputs = []
         value = 0
+        end = len(sources)
+        while end > 0:
+            covering = bisect.bisect_left(amounts, amount - value, 0, end)
+            if covering < end:
+                inputs.append(sources[covering])
+                return inputs
+            end -= 1
+            inputs.append(sources[end])
+            value += amounts[end]
+        return None
+
+    @staticmethod
+    def _smallest_inputs(sources, amount):
+        """
+        Select the smallest sources first
+
+        :param list sources: The sources, sorted by amount
+        :param int amount: The amount target value
+        :return: The selected sources, or None if MAX_INPUTS sources do not cover the amount
+        """
         inputs = []
-        cache = self.caches[community.currency]
-
-        buf_inputs = list(cache.available_sources)
-        for s in cache.available_sources:
-            value += s.amount
-            s.index = 0
+        value = 0
+        for s in sources[:MAX_INPUTS]:
             inputs.append(s)
-            buf_inputs.remove(s)
+            value += s.amount
             if value >= amount:
-                return (inputs, buf_inputs)
+                return inputs
+        return None
 
-        raise NotEnoughMoneyError(value, community.currency,
-                                  len(inputs), amount)
+    def tx_inputs(self, amount, community, strategy=CoinSelection.FEWEST_INPUTS):
+        """
+        Get inputs to generate a transaction with a given amount of money
+
+        :param int amount: The amount target value
+        :param community: The community target of the transaction
+        :param CoinSelection strategy: The strategy selecting the sources
+
+        :return: The list of inputs to use in the transaction document,
+        and the list of the sources left spendable
+        """
+        sources = self.caches[community.currency].spendable_sources
+        amounts = [s.amount for s in sources]
+
+        inputs = None
+        if strategy == CoinSelection.EXACT_MATCH:
+            exact = bisect.bisect_left(amounts, amount)
+            if exact < len(amounts) and amounts[exact] == amount:
+                inputs = [sources[exact]]
+        elif strategy == CoinSelection.CONSOLIDATE:
+            inputs = Wallet._smallest_inputs(sources, amount)
+
+        if inputs is None:
+            inputs = Wallet._fewest_inputs(sources, amounts, amount)
+        if inputs is None:
+            raise NotEnoughMoneyError(sum(amounts), community.currency,
+                                      len(sources), amount)
+
+        selected = set(id(s) for s in inputs)
+        for s in inputs:
+            s.index = 0
+        return (inputs, [s for s in sources if id(s) not in selected])
 
     def tx_outputs(self, pubkey, amount, inputs):
         """
@@ -210,7 +283,7 @@ class Wallet(QObject):
         return outputs
 
     async def send_money(self, salt, password, community,
-                   recipient, amount, message):
+                   recipient, amount, message, strategy=CoinSelection.FEWEST_INPUTS):
         """
         Send money to a given recipient in a specified community
 
@@ -220,6 +293,7 @@ class Wallet(QObject):
         :param str recipient: The pubkey of the recipient
         :param int amount: The amount of money to transfer
         :param str message: The message to send with the transfer
+        :param CoinSelection strategy: The strategy selecting the sources spent by the transfer
         """
         try:
             blockid = await community.blockid()
@@ -261,12 +335,12 @@ class Wallet(QObject):
                     }
         transfer = Transfer.initiate(metadata)
 
-        self.caches[community.currency]._transfers.append(transfer)
+        self.caches[community.currency].add_transfer(transfer)
 
         try:
-            result = self.tx_inputs(int(amount), community)
+            result = self.tx_inputs(int(amount), community, strategy)
             inputs = result[0]
-            self.caches[community.currency].available_sources = result[1][1:]
+            self.caches[community.currency].reserve_sources(transfer, inputs)
         except NotEnoughMoneyError as e:
             return False, str(e)
         logging.debug("Inputs : {0}".format(inputs))
@@ -289,15 +363,23 @@ class Wallet(QObject):
         :param sakia.core.community.Community community: The community where we want available sources
         :return: List of InputSource ucoinpy objects
         """
-        tx = []
         try:
-            data = await community.bma_access.future_request(bma.tx.Sources,
-                                     req_args={'pubkey': self.pubkey})
-            for s in data['sources']:
-                tx.append(InputSource.from_bma(s))
+            return await self.request_sources(community)
         except NoPeerAvailable as e:
             logging.debug(str(e))
-        return tx
+        return []
+
+    async def request_sources(self, community):
+        """
+        Request the available sources in a given community
+
+        :param sakia.core.community.Community community: The community where we want available sources
+        :return: List of InputSource ucoinpy objects
+        :raise NoPeerAvailable: if the sources could not be requested
+        """
+        data = await community.bma_access.future_request(bma.tx.Sources,
+                                                         req_args={'pubkey': self.pubkey})
+        return [InputSource.from_bma(s) for s in data['sources']]
 
     def transfers(self, community):
         """
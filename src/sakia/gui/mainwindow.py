@@ -415,7 +415,7 @@ class MainWindow(QObject):
                 path = selected_file[0]
             else:
                 path = selected_file[0] + ".acc"
-            self.app.export_account(path, self.account)
+            asyncio.ensure_future(self.app.export_account(path, self.account))
 
     def eventFilter(self, target, event):
         """
@@ -11,6 +11,7 @@ from PyQt5.QtCore import QRegExp, Qt, QObject
 from PyQt5.QtGui import QRegExpValidator
 
 from ..gen_resources.transfer_uic import Ui_TransferMoneyDialog
+from ..core.wallet import CoinSelection
 from .widgets import toast
 from .widgets.dialogs import QAsyncMessageBox, QMessageBox
 from ..tools.decorators import asyncify
@@ -72,6 +73,10 @@ class TransferMoneyDialog(QObject):
         for wallet in self.account.wallets:
             self.ui.combo_wallets.addItem(wallet.name)
 
+        self.ui.combo_strategy.addItem(self.tr("As few as possible"), CoinSelection.FEWEST_INPUTS)
+        self.ui.combo_strategy.addItem(self.tr("A source of the exact amount"), CoinSelection.EXACT_MATCH)
+        self.ui.combo_strategy.addItem(self.tr("The smallest ones first"), CoinSelection.CONSOLIDATE)
+
         for contact_name in sorted([c['name'] for c in account.contacts], key=str.lower):
             self.ui.combo_contact.addItem(contact_name)
 
@@ -126,6 +131,7 @@ class TransferMoneyDialog(QObject):
         else:
             recipient = self.ui.edit_pubkey.text()
         amount = self.ui.spinbox_amount.value()
+        strategy = self.ui.combo_strategy.currentData()
 
         if not amount:
             await QAsyncMessageBox.critical(self, self.tr("Money transfer"),
@@ -141,7 +147,7 @@ class TransferMoneyDialog(QObject):
         QApplication.setOverrideCursor(Qt.WaitCursor)
         QApplication.processEvents()
         result = await self.wallet.send_money(self.account.salt, password, self.community,
-                                   recipient, amount, comment)
+                                   recipient, amount, comment, strategy)
         if result[0]:
             if self.app.preferences['notifications']:
                 toast.display(self.tr("Transfer"),
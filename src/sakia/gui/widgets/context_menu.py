@@ -1,6 +1,6 @@
 from PyQt5.QtWidgets import QMenu, QAction, QApplication, QMessageBox
 from PyQt5.QtCore import QObject, pyqtSignal
-from ucoinpy.documents import Block, Membership
+from ucoinpy.documents import Membership
 import logging
 
 from ..member import MemberDialog
@@ -8,6 +8,7 @@ from ..contact import ConfigureContactDialog
 from ..transfer import TransferMoneyDialog
 from ..certification import CertificationDialog
 from ...tools.decorators import asyncify
+from ...tools.documents import parse_block
 from ...core.transfer import Transfer, TransferState
 from ...core.registry import Identity
 from ...tools.exceptions import MembershipNotFoundError
@@ -181,7 +182,7 @@ QMessageBox.Ok | QMessageBox.Cancel)
         clipboard = QApplication.clipboard()
         block = await self._community.get_block(number)
         if block:
-            block_doc = Block.from_signed_raw("{0}{1}\n".format(block['raw'], block['signature']))
+            block_doc = parse_block("{0}{1}\n".format(block['raw'], block['signature']))
             clipboard.setText(block_doc.signed_raw())
 
     @asyncify
@@ -197,7 +198,7 @@ QMessageBox.Ok | QMessageBox.Cancel)
             if membership:
                 block_number = membership['written']
                 block = await self._community.get_block(block_number)
-                block_doc = Block.from_signed_raw("{0}{1}\n".format(block['raw'], block['signature']))
+                block_doc = parse_block("{0}{1}\n".format(block['raw'], block['signature']))
                 for ms_doc in block_doc.joiners:
                     if ms_doc.issuer == identity.pubkey:
                         clipboard.setText(ms_doc.signed_raw())
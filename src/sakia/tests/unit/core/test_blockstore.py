@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+from ucoinpy.documents.block import Block
+from ucoinpy.documents.transaction import Transaction, InputSource, OutputSource
+from sakia.core.blockstore import BlockStore
+from sakia.tests.mocks.bma import nice_blockchain
+
+
+class TestBlockStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = BlockStore(os.path.join(self.tmp_dir.name, "test_currency.sqlite"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def test_headers(self):
+        block = nice_blockchain.bma_blockchain_current
+        signed_raw = "{0}{1}\n".format(block['raw'], block['signature'])
+        block_doc = Block.from_signed_raw(signed_raw)
+        self.store.add(block['hash'], signed_raw, block_doc)
+        self.assertIn(30898, self.store)
+        self.assertNotIn(30899, self.store)
+        self.assertEqual(self.store.block(30898), (block['hash'], signed_raw))
+        self.assertEqual(self.store.numbers(0, 30898), [30898])
+        self.assertEqual(self.store.numbers(0, 30897), [])
+        self.assertEqual(self.store.header(30898)['medianTime'], 1441614759)
+        self.assertEqual(self.store.median_time(30898), 1441614759)
+        self.assertIsNone(self.store.median_time(30899))
+        self.assertEqual(self.store.number(block['hash']), 30898)
+        self.assertEqual(self.store.dividends_blocks(0, 30898), [])
+
+    def test_commit(self):
+        block = nice_blockchain.bma_blockchain_current
+        signed_raw = "{0}{1}\n".format(block['raw'], block['signature'])
+        self.store.add(block['hash'], signed_raw, Block.from_signed_raw(signed_raw))
+        # The blocks are written together by the commit
+        other = BlockStore(self.store.path)
+        self.assertNotIn(30898, other)
+        self.store.commit()
+        self.assertIn(30898, other)
+        other.close()
+
+    def test_transactions(self):
+        issuer = "HnFcSms8jzwngtVomTTnzudZx7SHUQY8sVE1y8yBmULk"
+        receiver = "7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ"
+        tx = Transaction(1, "test_currency", [issuer],
+                         [InputSource(0, 'D', 10, "0000CB4E9CCDE6F579135331C97F13903E8B6E21", 100)],
+                         [OutputSource(receiver, 100)], "",
+                         ["42yQm4hGTJYWkPg39hQAUgP6S6EQ4vTfXdJuxKEHL1ih6YHiDL2hcwrFgBHjXLRgxRhj2VNVqqc6b4JayKqTE14r"])
+        block_doc = Mock(number=12, currency="test_currency", mediantime=1441614759,
+                         members_count=4, ud=100, transactions=[tx])
+        self.store.add("0000AB4E9CCDE6F579135331C97F13903E8B6E21", "", block_doc)
+        self.assertEqual(self.store.dividends_blocks(0, 12), [12])
+        self.assertEqual(self.store.dividends_blocks(13, 20), [])
+        for pubkey in (issuer, receiver):
+            self.assertEqual(self.store.transactions_blocks(pubkey, 0, 12), [12])
+        self.assertEqual(self.store.transactions_blocks(issuer, 13, 20), [])
+        self.assertEqual(self.store.transactions_blocks("other", 0, 12), [])
@@ -1,5 +1,7 @@
 import unittest
 import time
+import asyncio
+from unittest.mock import patch, PropertyMock
 from PyQt5.QtCore import QLocale
 from sakia.core.registry.identities import Identity, IdentitiesRegistry, LocalState, BlockchainState
 
@@ -8,7 +10,10 @@ from sakia.tests import QuamashTest
 from sakia.core import Application, Community
 from sakia.core.net import Network, Node
 from ucoinpy.documents.peer import Peer
+from ucoinpy.documents import BlockId
+from ucoinpy.api import bma
 from sakia.core.net.api.bma.access import BmaAccess
+from sakia.core.net.api.bma.cache import CacheKey
 
 
 class TestBmaAccess(unittest.TestCase, QuamashTest):
@@ -40,9 +45,86 @@ BASIC_MERKLED_API ucoin.inso.ovh 80
     def tearDown(self):
         self.tearDownQuamash()
 
-    def test_compare_json_with_nonetype(self):
-        res = self.bma_access._compare_json({}, corrupted.bma_null_data)
+    def test_update_cache_with_nonetype(self):
+        self.bma_access._update_cache(bma.blockchain.Parameters, {}, {}, {})
+        res = self.bma_access._update_cache(bma.blockchain.Parameters, {}, {}, corrupted.bma_null_data)
+        self.assertTrue(res)
+        res = self.bma_access._update_cache(bma.blockchain.Parameters, {}, {}, corrupted.bma_null_data)
         self.assertFalse(res)
 
+    def test_pick_node(self):
+        fast_node = Node(self.peer,
+                         "", "8Fi1VSTbjkXguwThF4v2ZxC5whK7pwG2vcGTkPUPjPGU",
+                         None, Node.ONLINE,
+                         time.time(), {}, "ucoin", "0.12.0", 0)
+        fast_node.record_reply(0.1)
+        self.node.record_reply(5)
+        self.node.record_error()
+        with patch('random.random', return_value=0.5):
+            for i in range(0, 10):
+                self.assertEqual(self.bma_access._pick_node([self.node, fast_node]), fast_node)
+
+    def test_future_request_single_flight(self):
+        requests = []
+
+        async def timed_get(req, **get_args):
+            requests.append(req)
+            await asyncio.sleep(0.1)
+            return {'currency': "test_currency"}
+
+        async def exec_test():
+            with patch.object(self.node, 'bma_request'), \
+                 patch.object(self.node, 'timed_get', side_effect=timed_get):
+                replies = await asyncio.gather(self.bma_access.future_request(bma.blockchain.Parameters),
+                                               self.bma_access.future_request(bma.blockchain.Parameters),
+                                               self.bma_access.future_request(bma.blockchain.Parameters))
+            self.assertEqual(len(requests), 1)
+            for reply in replies:
+                self.assertEqual(reply['currency'], "test_currency")
+
+        self.lp.run_until_complete(exec_test())
+
+    def test_inject_block(self):
+        block = dict(nice_blockchain.bma_blockchain_current)
+        block['dividend'] = 100
+        self.node.set_block({'number': block['number'] - 1, 'hash': block['previousHash']})
+        self.bma_access._update_cache(bma.blockchain.TX, {}, {}, {'result': {'blocks': [2, 8]}})
+        self.bma_access._update_cache(bma.blockchain.UD, {}, {}, {'result': {'blocks': [5]}})
+
+        self.node.set_block(block)
+        self.bma_access.inject_block(block)
+        need_reload, data = self.bma_access._get_from_cache(bma.blockchain.Block, {'number': block['number']}, {})
+        self.assertFalse(need_reload)
+        self.assertEqual(data['hash'], block['hash'])
+        need_reload, data = self.bma_access._get_from_cache(bma.blockchain.TX, {}, {})
+        self.assertFalse(need_reload)
+        self.assertEqual(data['result']['blocks'], [2, 8])
+        need_reload, data = self.bma_access._get_from_cache(bma.blockchain.UD, {}, {})
+        self.assertFalse(need_reload)
+        self.assertEqual(data['result']['blocks'], [5, block['number']])
+
+    def test_rollback_then_grow(self):
+        with patch.object(Network, 'fork_window', new_callable=PropertyMock, return_value=10), \
+             patch.object(Network, 'current_blockid', new_callable=PropertyMock) as current_blockid:
+            current_blockid.return_value = BlockId(100, "0000CB4E9CCDE6F579135331C97F13903E8B6E21")
+            self.bma_access._update_cache(bma.blockchain.Block, {'number': 95}, {},
+                                          {'number': 95, 'hash': "FORKHASH", 'dividend': None})
+            self.bma_access.rollback()
+
+            # The block left the fork window, but it could have been rolled back
+            current_blockid.return_value = BlockId(110, "00003BDA844D77EEE7CF32A6C3C87F2ACBFCFCBB")
+            need_reload, data = self.bma_access._get_from_cache(bma.blockchain.Block, {'number': 95}, {})
+            self.assertTrue(need_reload)
+            self.assertFalse(self.bma_access._data.is_permanent(CacheKey.from_request(bma.blockchain.Block,
+                                                                                     {'number': 95}, {})))
+
+            self.bma_access._update_cache(bma.blockchain.Block, {'number': 95}, {},
+                                          {'number': 95, 'hash': "MAINHASH", 'dividend': None})
+            need_reload, data = self.bma_access._get_from_cache(bma.blockchain.Block, {'number': 95}, {})
+            self.assertFalse(need_reload)
+            self.assertEqual(data['hash'], "MAINHASH")
+            self.assertTrue(self.bma_access._data.is_permanent(CacheKey.from_request(bma.blockchain.Block,
+                                                                                    {'number': 95}, {})))
+
     def test_filter_nodes(self):
         pass#TODO
@@ -0,0 +1,123 @@
+import unittest
+from ucoinpy.api import bma
+from sakia.core.net.api.bma.cache import BmaCache, CacheKey, json_digest
+
+
+def block_key(number):
+    return CacheKey.from_request(bma.blockchain.Block, {'number': number}, {})
+
+
+def block_entry(number, dividend=None):
+    return {'metadata': {},
+            'value': {'number': number, 'dividend': dividend}}
+
+
+class TestBmaCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = BmaCache(max_entries={str(bma.blockchain.Block): 3})
+        for i in range(0, 3):
+            cache.put(block_key(i), block_entry(i))
+        cache.get(block_key(0))
+        cache.put(block_key(3), block_entry(3))
+        self.assertEqual(len(cache), 3)
+        self.assertIn(block_key(0), cache)
+        self.assertNotIn(block_key(1), cache)
+        self.assertIn(block_key(3), cache)
+
+    def test_pinned_entries(self):
+        cache = BmaCache(max_entries={str(bma.blockchain.Block): 2})
+        cache.put(block_key(0), block_entry(0, 100), pinned=True)
+        for i in range(1, 5):
+            cache.put(block_key(i), block_entry(i))
+        self.assertIn(block_key(0), cache)
+        self.assertIn(block_key(4), cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_size_eviction(self):
+        cache = BmaCache(max_size=200)
+        for i in range(0, 20):
+            cache.put(block_key(i), block_entry(i))
+        self.assertLessEqual(cache.size, 200)
+        self.assertIn(block_key(19), cache)
+        self.assertNotIn(block_key(0), cache)
+
+    def test_pop_request(self):
+        cache = BmaCache()
+        lookup_key = CacheKey.from_request(bma.wot.Lookup, {'search': "john"}, {})
+        cache.put(lookup_key, {'metadata': {}, 'value': {'results': []}})
+        cache.put(block_key(0), block_entry(0))
+        cache.pop_request(str(bma.wot.Lookup))
+        self.assertNotIn(lookup_key, cache)
+        self.assertIn(block_key(0), cache)
+        self.assertEqual(cache.size, len('{"dividend":null,"number":0}'))
+
+    def test_update(self):
+        cache = BmaCache()
+        self.assertTrue(cache.update(block_key(0), {'number': 0, 'dividend': None}, {'block_number': 10}))
+        self.assertEqual(cache.digest(block_key(0)), json_digest({'dividend': None, 'number': 0})[0])
+        self.assertFalse(cache.update(block_key(0), {'dividend': None, 'number': 0}, {'block_number': 11}))
+        self.assertEqual(cache.get(block_key(0))['metadata']['block_number'], 11)
+        self.assertTrue(cache.update(block_key(0), {'number': 0, 'dividend': 100}, {'block_number': 12}))
+        self.assertEqual(cache.get(block_key(0))['value']['dividend'], 100)
+
+        # The nodes can send the elements of a list in any order
+        tx_key = CacheKey.from_request(bma.blockchain.TX, {}, {})
+        self.assertTrue(cache.update(tx_key, {'result': {'blocks': [2, 8]}}, {}))
+        self.assertFalse(cache.update(tx_key, {'result': {'blocks': [8, 2]}}, {}))
+
+    def test_permanent_tier(self):
+        cache = BmaCache(max_entries={str(bma.blockchain.Block): 2})
+        cache.put(block_key(0), block_entry(0), permanent=True)
+        cache.put(block_key(1), block_entry(1))
+        cache.promote(block_key(1))
+        for i in range(2, 6):
+            cache.put(block_key(i), block_entry(i))
+        self.assertTrue(cache.is_permanent(block_key(0)))
+        self.assertTrue(cache.is_permanent(block_key(1)))
+        self.assertFalse(cache.is_permanent(block_key(5)))
+        self.assertEqual(len(cache), 4)
+        self.assertFalse(cache.update(block_key(1), {'number': 1, 'dividend': None}, {}))
+        self.assertEqual(cache.get(block_key(1))['value']['number'], 1)
+
+    def test_key_json(self):
+        key = CacheKey.from_request(bma.network.peering.Peers, {}, {'leaves': "true"})
+        self.assertEqual(CacheKey.from_json(key.jsonify()), key)
+        self.assertEqual(hash(CacheKey.from_json(key.jsonify())), hash(key))
+        self.assertEqual(key.arg('leaves'), "true")
+        self.assertIsNone(key.arg('leaf'))
+
+    def test_legacy_key(self):
+        legacy = [str(bma.blockchain.Block), "('number',)", "(42,)", "()", "()"]
+        self.assertEqual(CacheKey.from_json(legacy), block_key(42))
+        ambiguous = [str(bma.blockchain.Block), "('a', 'b')", "(1, 2)", "()", "()"]
+        self.assertIsNone(CacheKey.from_json(ambiguous))
+
+    def test_pop_request_permanent(self):
+        cache = BmaCache()
+        lookup_key = CacheKey.from_request(bma.wot.Lookup, {'search': "john"}, {})
+        cache.put(lookup_key, {'metadata': {}, 'value': {'results': []}}, permanent=True)
+        cache.put(block_key(0), block_entry(0), permanent=True)
+        cache.pop_request(str(bma.wot.Lookup))
+        self.assertNotIn(lookup_key, cache)
+        self.assertIn(block_key(0), cache)
+
+    def test_unconfirmed_blocks(self):
+        cache = BmaCache()
+        cache.put(block_key(0), block_entry(0), permanent=True)
+        for i in range(1, 10):
+            cache.put(block_key(i), block_entry(i))
+        cache.unconfirm_blocks(5)
+        self.assertEqual(cache.unconfirmed_from, 5)
+        self.assertTrue(cache.confirmed(block_key(0)))
+        self.assertTrue(cache.confirmed(block_key(4)))
+        self.assertFalse(cache.confirmed(block_key(5)))
+        self.assertFalse(cache.confirmed(block_key(9)))
+
+        cache.confirm_blocks(6)
+        self.assertTrue(cache.confirmed(block_key(6)))
+        self.assertFalse(cache.confirmed(block_key(7)))
+        cache.update(block_key(9), {'number': 9, 'dividend': 100}, {})
+        self.assertTrue(cache.confirmed(block_key(9)))
+        cache.pop(block_key(8))
+        cache.confirm_blocks(7)
+        self.assertIsNone(cache.unconfirmed_from)
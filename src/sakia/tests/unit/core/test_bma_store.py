@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+from ucoinpy.api import bma
+from sakia.core.net.api.bma.cache import BmaCache, CacheKey
+from sakia.core.net.api.bma.store import BmaStore
+
+
+def block_key(number):
+    return CacheKey.from_request(bma.blockchain.Block, {'number': number}, {})
+
+
+def block_entry(number, dividend=None):
+    return {'metadata': {},
+            'value': {'number': number, 'dividend': dividend}}
+
+
+class TestBmaStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "test_bma.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_flush_and_load(self):
+        cache = BmaCache()
+        cache.put(block_key(0), block_entry(0, 100), pinned=True)
+        cache.attach(BmaStore(self.path))
+        for i in range(1, 5):
+            cache.put(block_key(i), block_entry(i))
+        cache.close()
+
+        cache = BmaCache()
+        cache.attach(BmaStore(self.path))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get(block_key(3))['value']['number'], 3)
+        self.assertEqual(cache.get(block_key(0))['value']['dividend'], 100)
+        self.assertIn(block_key(0), cache)
+        self.assertEqual(len(cache), 2)
+        cache.close()
+
+    def test_evicted_entries(self):
+        cache = BmaCache(max_entries={str(bma.blockchain.Block): 2})
+        cache.attach(BmaStore(self.path))
+        for i in range(0, 5):
+            cache.put(block_key(i), block_entry(i))
+        self.assertEqual(cache.get(block_key(0))['value']['number'], 0)
+        cache.flush()
+        cache.put(block_key(5), block_entry(5))
+        cache.put(block_key(6), block_entry(6))
+        self.assertEqual(cache.get(block_key(1))['value']['number'], 1)
+        cache.close()
+
+    def test_removed_entries(self):
+        lookup_key = CacheKey.from_request(bma.wot.Lookup, {'search': "john"}, {})
+        cache = BmaCache()
+        cache.attach(BmaStore(self.path))
+        cache.put(lookup_key, {'metadata': {}, 'value': {'results': []}})
+        cache.put(block_key(0), block_entry(0))
+        cache.put(block_key(1), block_entry(1))
+        cache.flush()
+        cache.pop_request(str(bma.wot.Lookup))
+        cache.pop(block_key(0))
+        cache.close()
+
+        cache = BmaCache()
+        cache.attach(BmaStore(self.path))
+        self.assertIsNone(cache.get(lookup_key))
+        self.assertIsNone(cache.get(block_key(0)))
+        self.assertIsNotNone(cache.get(block_key(1)))
+        cache.close()
+
+    def test_removed_entries_before_flush(self):
+        lookup_key = CacheKey.from_request(bma.wot.Lookup, {'search': "john"}, {})
+        cache = BmaCache()
+        cache.attach(BmaStore(self.path))
+        cache.put(lookup_key, {'metadata': {}, 'value': {'results': []}})
+        cache.put(block_key(0), block_entry(0))
+        cache.flush()
+
+        cache.pop_request(str(bma.wot.Lookup))
+        cache.pop(block_key(0))
+        self.assertIsNone(cache.get(lookup_key))
+        self.assertIsNone(cache.get(block_key(0)))
+
+        # Entries put again after their removal are found
+        cache.put(block_key(0), block_entry(0))
+        self.assertIsNotNone(cache.get(block_key(0)))
+        cache.close()
+
+    def test_begin_and_end_flush(self):
+        cache = BmaCache(max_entries={str(bma.blockchain.Block): 2})
+        store = BmaStore(self.path)
+        cache.attach(store)
+        for i in range(0, 5):
+            cache.put(block_key(i), block_entry(i))
+        changes = cache.begin_flush()
+        # The changes being written are still read by the cache
+        cache.pop(block_key(4))
+        self.assertEqual(cache.get(block_key(0))['value']['number'], 0)
+        self.assertIsNone(cache.get(block_key(4)))
+
+        # The changes which could not be written are written by the next flush,
+        # unless they were replaced meanwhile
+        cache.end_flush(changes, written=False)
+        cache.flush()
+        self.assertEqual(store.get(block_key(1))['value']['number'], 1)
+        self.assertIsNone(store.get(block_key(4)))
+        cache.close()
+
+    def test_unconfirmed_blocks(self):
+        cache = BmaCache()
+        cache.attach(BmaStore(self.path))
+        for i in range(0, 10):
+            cache.put(block_key(i), block_entry(i))
+        cache.unconfirm_blocks(5)
+        cache.close()
+
+        cache = BmaCache()
+        cache.attach(BmaStore(self.path))
+        self.assertEqual(cache.unconfirmed_from, 5)
+        cache.get(block_key(4))
+        cache.get(block_key(7))
+        self.assertTrue(cache.confirmed(block_key(4)))
+        self.assertFalse(cache.confirmed(block_key(7)))
+        cache.confirm_blocks(7)
+        self.assertTrue(cache.confirmed(block_key(7)))
+        self.assertEqual(cache.unconfirmed_from, 8)
+        cache.close()
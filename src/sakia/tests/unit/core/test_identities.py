@@ -5,7 +5,11 @@ import asyncio
 import quamash
 import logging
 from PyQt5.QtCore import QLocale
-from sakia.core.registry.identities import Identity, IdentitiesRegistry, LocalState, BlockchainState
+from ucoinpy.api import bma
+from ucoinpy.documents import BlockId
+from sakia.core.registry.identities import Identity, IdentitiesRegistry, LocalState, BlockchainState, \
+    NOT_FOUND_TTL
+from sakia.tests.mocks.bma import nice_blockchain
 from sakia.tests import QuamashTest
 
 
@@ -35,3 +39,168 @@ class TestIdentity(unittest.TestCase, QuamashTest):
                                                                    community)
         self.assertEqual(identity, identity_from_data)
 
+    def test_future_find_batch(self):
+        community = mock.MagicMock()
+        type(community).currency = mock.PropertyMock(return_value="test_currency")
+        known = Identity("john", "7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ", None,
+                         LocalState.COMPLETED, BlockchainState.VALIDATED)
+        identities_registry = IdentitiesRegistry({"test_currency": {known.pubkey: known}})
+        searched = []
+        running = []
+        max_running = []
+
+        async def future_find(pubkey, community):
+            searched.append(pubkey)
+            running.append(pubkey)
+            max_running.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(pubkey)
+            return Identity.from_handled_data("uid_" + pubkey, pubkey, None, BlockchainState.VALIDATED)
+
+        identities_registry.future_find = future_find
+
+        async def exec_test():
+            pubkeys = ["A", "B", "A", known.pubkey, "C", "D", "B"]
+            identities = await identities_registry.future_find_batch(pubkeys, community, concurrency=2)
+            self.assertEqual(sorted(searched), ["A", "B", "C", "D"])
+            self.assertEqual(max(max_running), 2)
+            self.assertEqual(identities["A"].uid, "uid_A")
+            self.assertEqual(identities[known.pubkey], known)
+
+        self.lp.run_until_complete(exec_test())
+
+    def test_future_find_single_flight(self):
+        community = mock.MagicMock()
+        type(community).currency = mock.PropertyMock(return_value="test_currency")
+        requests = []
+
+        async def simple_request(request, req_args):
+            requests.append(request)
+            await asyncio.sleep(0.01)
+            return {'uid': "john", 'sigDate': 1441130831}
+
+        community.bma_access.simple_request = simple_request
+        identities_registry = IdentitiesRegistry({})
+
+        async def exec_test():
+            identities = await asyncio.gather(*[identities_registry.future_find("7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ",
+                                                                                community) for _ in range(0, 3)])
+            self.assertEqual(len(requests), 1)
+            for identity in identities:
+                self.assertEqual(identity.uid, "john")
+
+        self.lp.run_until_complete(exec_test())
+
+    def test_future_find_not_found(self):
+        community = mock.MagicMock()
+        type(community).currency = mock.PropertyMock(return_value="test_currency")
+        community.network.current_blockid.number = 100
+        requests = []
+
+        async def simple_request(request, req_args):
+            requests.append(request)
+            raise ValueError("404 : Not found")
+
+        community.bma_access.simple_request = simple_request
+        identities_registry = IdentitiesRegistry({})
+
+        async def exec_test():
+            identity = await identities_registry.future_find("7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ", community)
+            self.assertEqual(identity.local_state, LocalState.NOT_FOUND)
+            # Membership and lookup
+            self.assertEqual(len(requests), 2)
+
+            await identities_registry.future_find("7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ", community)
+            self.assertEqual(len(requests), 2)
+
+            community.network.current_blockid.number = 100 + NOT_FOUND_TTL
+            await identities_registry.future_find("7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ", community)
+            self.assertEqual(len(requests), 4)
+
+        self.lp.run_until_complete(exec_test())
+
+    def test_refresh_members(self):
+        community = mock.MagicMock()
+        type(community).currency = mock.PropertyMock(return_value="test_currency")
+        members = {'results': [{'pubkey': "7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ", 'uid': "john"},
+                               {'pubkey': "FADxcH5LmXGmGFgdixSes6nWnC4Vb4pRUBYT81zQRhjn", 'uid': "doe"}]}
+        digests = ["D1"]
+
+        async def future_request(request):
+            return members
+
+        community.bma_access.future_request = future_request
+        community.bma_access.digest = lambda request: digests[-1]
+        community.network.current_blockid = BlockId(10, "0000CB4E9CCDE6F579135331C97F13903E8B6E21")
+        identities_registry = IdentitiesRegistry({})
+
+        async def exec_test():
+            self.assertTrue(await identities_registry.refresh_members(community))
+            identity = await identities_registry.future_find("FADxcH5LmXGmGFgdixSes6nWnC4Vb4pRUBYT81zQRhjn", community)
+            self.assertEqual(identity.uid, "doe")
+            self.assertEqual(identity.blockchain_state, BlockchainState.VALIDATED)
+
+            # The members list did not change
+            self.assertFalse(await identities_registry.refresh_members(community))
+
+            members['results'].append({'pubkey': "HnFcSms8jzwngtVomTTnzudZx7SHUQY8sVE1y8yBmULk", 'uid': "alice"})
+            digests.append("D2")
+            with mock.patch.object(identities_registry, 'from_handled_data',
+                                   wraps=identities_registry.from_handled_data) as from_handled_data:
+                self.assertTrue(await identities_registry.refresh_members(community))
+                self.assertEqual(from_handled_data.call_count, 1)
+
+            # The members who left are not members anymore
+            members['results'].pop(0)
+            digests.append("D3")
+            self.assertTrue(await identities_registry.refresh_members(community))
+            self.assertFalse(identities_registry.is_member("7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ", community))
+            self.assertTrue(identities_registry.is_member("HnFcSms8jzwngtVomTTnzudZx7SHUQY8sVE1y8yBmULk", community))
+
+        self.lp.run_until_complete(exec_test())
+
+    def test_refresh_members_from_blocks(self):
+        community = mock.MagicMock()
+        type(community).currency = mock.PropertyMock(return_value="test_currency")
+        members = {'results': [{'pubkey': "FADxcH5LmXGmGFgdixSes6nWnC4Vb4pRUBYT81zQRhjn", 'uid': "doe"}]}
+        # Block 2 has four joiners and block 3 excludes doe
+        blocks = {
+            2: dict(nice_blockchain.bma_blockchain_0,
+                    previousHash="000018AF2B59DA2F1D35C05F2AD3B4DFCD5EBAFB"),
+            3: dict(nice_blockchain.bma_blockchain_current,
+                    previousHash=nice_blockchain.bma_blockchain_0['hash'],
+                    raw=nice_blockchain.bma_blockchain_current['raw'].replace(
+                        "Excluded:\n", "Excluded:\nFADxcH5LmXGmGFgdixSes6nWnC4Vb4pRUBYT81zQRhjn\n"))
+        }
+        requests = []
+
+        async def future_request(request, req_args={}):
+            requests.append(request)
+            if request is bma.wot.Members:
+                return members
+            return blocks[req_args['number']]
+
+        community.bma_access.future_request = future_request
+        community.bma_access.digest = lambda request: "D1"
+        community.network.current_blockid = BlockId(1, "000018AF2B59DA2F1D35C05F2AD3B4DFCD5EBAFB")
+        identities_registry = IdentitiesRegistry({})
+
+        async def exec_test():
+            self.assertTrue(await identities_registry.refresh_members(community, 1))
+            requests.clear()
+            self.assertTrue(await identities_registry.refresh_members(community, 3))
+            self.assertNotIn(bma.wot.Members, requests)
+            self.assertTrue(identities_registry.is_member("8Fi1VSTbjkXguwThF4v2ZxC5whK7pwG2vcGTkPUPjPGU", community))
+            self.assertFalse(identities_registry.is_member("FADxcH5LmXGmGFgdixSes6nWnC4Vb4pRUBYT81zQRhjn", community))
+            identity = await identities_registry.future_find("8Fi1VSTbjkXguwThF4v2ZxC5whK7pwG2vcGTkPUPjPGU", community)
+            self.assertEqual(identity.uid, "inso")
+
+            # After a rollback, the members list is requested again
+            identities_registry._members_blocks["test_currency"] = BlockId(1, "000018AF2B59DA2F1D35C05F2AD3B4DFCD5EBAFB")
+            blocks[3]['previousHash'] = "0000AB4E9CCDE6F579135331C97F13903E8B6E21"
+            requests.clear()
+            await identities_registry.refresh_members(community, 3)
+            self.assertIn(bma.wot.Members, requests)
+            self.assertTrue(identities_registry.is_member("FADxcH5LmXGmGFgdixSes6nWnC4Vb4pRUBYT81zQRhjn", community))
+
+        self.lp.run_until_complete(exec_test())
@@ -119,4 +119,28 @@ BASIC_MERKLED_API ucoin.inso.ovh 80
         result = node.jsonify_root_node()
         self.assertEqual(result['pubkey'], "8Fi1VSTbjkXguwThF4v2ZxC5whK7pwG2vcGTkPUPjPGU")
         self.assertEqual(result['uid'], "inso")
-        self.assertEqual(result['peer'], peer.signed_raw())
\ No newline at end of file
+        self.assertEqual(result['peer'], peer.signed_raw())
+
+    def test_score(self):
+        peer = Peer.from_signed_raw("""Version: 1
+Type: Peer
+Currency: meta_brouzouf
+PublicKey: 8Fi1VSTbjkXguwThF4v2ZxC5whK7pwG2vcGTkPUPjPGU
+Block: 48698-000005E0F228038E4DDD4F6CA4ACB01EC88FBAF8
+Endpoints:
+BASIC_MERKLED_API ucoin.inso.ovh 80
+82o1sNCh1bLpUXU6nacbK48HBcA9Eu2sPkL1/3c2GtDPxBUZd2U2sb7DxwJ54n6ce9G0Oy7nd1hCxN3fS0oADw==
+""")
+        node = Node(peer, "inso", "8Fi1VSTbjkXguwThF4v2ZxC5whK7pwG2vcGTkPUPjPGU", nice_blockchain.bma_blockchain_current,
+                 Node.ONLINE, 1111111111, {}, "ucoin", "0.12", 0)
+        self.assertEqual(node.score, 0)
+        node.record_reply(1)
+        self.assertEqual(node.latency, 1)
+        node.record_reply(2)
+        self.assertAlmostEqual(node.latency, 1.3)
+        score = node.score
+        node.record_error()
+        self.assertGreater(node.score, score)
+        score = node.score
+        node._in_flight = 2
+        self.assertAlmostEqual(node.score, score + 2 * node.latency)
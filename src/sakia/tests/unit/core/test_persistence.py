@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+import unittest
+from PyQt5.QtCore import QLocale
+from sakia.core.persistence import Persistence
+from sakia.tests import QuamashTest
+
+
+class TestPersistence(unittest.TestCase, QuamashTest):
+    def setUp(self):
+        self.setUpQuamash()
+        QLocale.setDefault(QLocale("en_GB"))
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        self.tearDownQuamash()
+
+    def test_flush(self):
+        persistence = Persistence(self.lp)
+        path = os.path.join(self.tmp_dir.name, "data")
+        data = {'value': 1}
+        calls = []
+
+        def jsonify():
+            calls.append(1)
+            return dict(data)
+
+        persistence.mark_dirty(path, jsonify)
+        data['value'] = 2
+        persistence.mark_dirty(path, jsonify)
+        self.assertEqual(persistence.dirty, [path])
+        self.assertFalse(os.path.exists(path))
+
+        self.lp.run_until_complete(persistence.flush())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(persistence.dirty, [])
+        self.assertFalse(os.path.exists(path + ".buf"))
+        with open(path, 'r') as json_data:
+            self.assertEqual(json.load(json_data), {'value': 2})
+
+    def test_discard(self):
+        persistence = Persistence(self.lp)
+        account_path = os.path.join(self.tmp_dir.name, "john")
+        other_path = os.path.join(self.tmp_dir.name, "johnny")
+        persistence.mark_dirty(os.path.join(account_path, 'properties'), lambda: {})
+        persistence.mark_dirty(os.path.join(other_path, 'properties'), lambda: {})
+        persistence.discard(account_path)
+        self.assertEqual(persistence.dirty, [os.path.join(other_path, 'properties')])
+
+    def test_flush_error(self):
+        persistence = Persistence(self.lp)
+        path = os.path.join(self.tmp_dir.name, "john", "properties")
+        persistence.mark_dirty(path, lambda: {'value': 1})
+
+        # The directory of the file does not exist
+        self.lp.run_until_complete(persistence.flush())
+        self.assertEqual(persistence.dirty, [path])
+
+        os.mkdir(os.path.join(self.tmp_dir.name, "john"))
+        self.lp.run_until_complete(persistence.flush())
+        self.assertEqual(persistence.dirty, [])
+        with open(path, 'r') as json_data:
+            self.assertEqual(json.load(json_data), {'value': 1})
@@ -0,0 +1,45 @@
+import unittest
+from unittest.mock import patch
+from PyQt5.QtCore import QLocale
+from ucoinpy.api import bma
+from ucoinpy.documents.peer import BMAEndpoint
+from sakia.core.net.pool import SessionsPool
+from sakia.tests import QuamashTest
+
+
+class TestSessionsPool(unittest.TestCase, QuamashTest):
+    def setUp(self):
+        self.setUpQuamash()
+        QLocale.setDefault(QLocale("en_GB"))
+
+    def tearDown(self):
+        self.tearDownQuamash()
+
+    def test_same_session_per_endpoint(self):
+        pool = SessionsPool()
+        endpoint = BMAEndpoint("", "127.0.0.1", "", 50005)
+        other_endpoint = BMAEndpoint("", "127.0.0.1", "", 50006)
+        session, conn_handler = pool.session(endpoint)
+        self.assertEqual(pool.session(endpoint)[0], session)
+        self.assertNotEqual(pool.session(other_endpoint)[0], session)
+        self.lp.run_until_complete(pool.close())
+
+    def test_request_uses_session(self):
+        pool = SessionsPool()
+        endpoint = BMAEndpoint("", "127.0.0.1", "", 50005)
+        req = pool.request(bma.blockchain.Block, endpoint, 12)
+        self.assertEqual(req.connection_handler.session, pool.session(endpoint)[0])
+        self.assertEqual(req.connection_handler.port, 50005)
+        self.lp.run_until_complete(pool.close())
+
+    @patch('time.monotonic')
+    def test_evict_idle(self, monotonic):
+        pool = SessionsPool(idle_timeout=60)
+        endpoint = BMAEndpoint("", "127.0.0.1", "", 50005)
+        other_endpoint = BMAEndpoint("", "127.0.0.1", "", 50006)
+        monotonic.return_value = 0
+        session = pool.session(endpoint)[0]
+        monotonic.return_value = 100
+        pool.session(other_endpoint)
+        self.assertNotEqual(pool.session(endpoint)[0], session)
+        self.lp.run_until_complete(pool.close())
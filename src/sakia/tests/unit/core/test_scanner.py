@@ -0,0 +1,89 @@
+import unittest
+from asynctest.mock import Mock, CoroutineMock, patch
+from PyQt5.QtCore import QLocale
+from ucoinpy.documents.block import Block
+from sakia.core.scanner import BlockScanner
+from sakia.tools.documents import DocumentsCache
+from sakia.tests.mocks.bma import nice_blockchain
+from sakia.tests import QuamashTest
+
+
+class TestBlockScanner(unittest.TestCase, QuamashTest):
+    def setUp(self):
+        self.setUpQuamash()
+        QLocale.setDefault(QLocale("en_GB"))
+
+    def tearDown(self):
+        self.tearDownQuamash()
+
+    def test_scan_once(self):
+        block = dict(nice_blockchain.bma_blockchain_current)
+        community = Mock()
+        community.network.current_blockid.number = 15
+        community.network.fork_window = 100
+        community.bma_access.future_request = CoroutineMock(side_effect=lambda *args, **kwargs: block)
+        documents = DocumentsCache()
+        scanner = BlockScanner(documents=documents)
+
+        async def exec_test():
+            with patch('ucoinpy.documents.block.Block.from_signed_raw',
+                       side_effect=Block.from_signed_raw) as from_signed_raw:
+                scanned_block = await scanner.scan(community, 15)
+                self.assertEqual(scanned_block.doc.number, 30898)
+                self.assertEqual(scanned_block.transactions(block['issuer']), [])
+                self.assertEqual(await scanner.scan(community, 15), scanned_block)
+                self.assertEqual(from_signed_raw.call_count, 1)
+
+                # The block was rolled back
+                block['hash'] = "0000AB4E9CCDE6F579135331C97F13903E8B6E21"
+                block['raw'] = block['raw'].replace("Nonce: 6909", "Nonce: 6910")
+                self.assertNotEqual(await scanner.scan(community, 15), scanned_block)
+                self.assertEqual(from_signed_raw.call_count, 2)
+
+                # Another scanner sharing the parsed documents does not parse the block again
+                other = BlockScanner(documents=documents)
+                await other.scan(community, 15)
+                self.assertEqual(from_signed_raw.call_count, 2)
+
+        self.lp.run_until_complete(exec_test())
+
+    def test_bounded(self):
+        block = nice_blockchain.bma_blockchain_current
+        community = Mock()
+        community.network.current_blockid.number = 15
+        community.network.fork_window = 100
+        community.bma_access.future_request = CoroutineMock(return_value=block)
+        scanner = BlockScanner(max_blocks=2, documents=DocumentsCache())
+
+        async def exec_test():
+            first = await scanner.scan(community, 1)
+            await scanner.scan(community, 2)
+            await scanner.scan(community, 3)
+            self.assertNotEqual(await scanner.scan(community, 1), first)
+
+        self.lp.run_until_complete(exec_test())
+
+    def test_stored_blocks_without_transactions(self):
+        store = Mock()
+        store.numbers = Mock(return_value=[10, 12, 14])
+        store.transactions_blocks = Mock(return_value=[12])
+        scanner = BlockScanner(store)
+        self.assertEqual(scanner.stored_blocks_without_transactions("pubkey", 0, 20), {10, 14})
+        store.transactions_blocks.assert_called_once_with("pubkey", 0, 20)
+        self.assertEqual(BlockScanner().stored_blocks_without_transactions("pubkey", 0, 20), set())
+
+    def test_header(self):
+        store = Mock()
+        store.header = Mock(side_effect=lambda number: {'number': number, 'medianTime': 10} if number < 10 else None)
+        community = Mock()
+        community.bma_access.future_request = CoroutineMock(return_value={'number': 12, 'medianTime': 20})
+        scanner = BlockScanner(store)
+
+        async def exec_test():
+            self.assertEqual((await scanner.header(community, 5))['medianTime'], 10)
+            community.bma_access.future_request.assert_not_called()
+            self.assertEqual((await scanner.header(community, 12))['medianTime'], 20)
+
+        self.lp.run_until_complete(exec_test())
+        scanner.commit()
+        store.commit.assert_called_once_with()
@@ -3,9 +3,16 @@ import unittest
 import asyncio
 import quamash
 import logging
+from unittest import mock
+from asynctest.mock import CoroutineMock
 from PyQt5.QtCore import QLocale
+from ucoinpy.documents.transaction import InputSource
 from sakia.core.registry.identities import IdentitiesRegistry
 from sakia.core import Wallet
+from sakia.core.wallet import CoinSelection
+from sakia.core.txhistory import TxHistory
+from sakia.core.transfer import TransferState
+from sakia.tools.exceptions import NotEnoughMoneyError
 from sakia.tests import QuamashTest
 
 
@@ -28,3 +35,80 @@ class TestWallet(unittest.TestCase, QuamashTest):
         self.assertEqual(wallet.pubkey, wallet_from_json.pubkey)
         self.assertEqual(wallet.name, wallet_from_json.name)
         self.assertEqual(wallet._identities_registry, wallet_from_json._identities_registry)
+
+    def test_tx_inputs_strategies(self):
+        wallet = Wallet(0, "7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ",
+                        "Wallet 1", self.identities_registry)
+        community = mock.Mock()
+        community.currency = "test_currency"
+        wallet.caches["test_currency"] = TxHistory(mock.Mock(), wallet)
+        wallet.caches["test_currency"].available_sources = [InputSource(None, 'D', n, "HASH{0}".format(n), amount)
+                                                            for n, amount in enumerate([10, 10, 10, 50, 120, 10, 35])]
+
+        inputs, available = wallet.tx_inputs(40, community)
+        self.assertEqual([s.amount for s in inputs], [50])
+        self.assertEqual(len(available), 6)
+
+        inputs, available = wallet.tx_inputs(200, community)
+        self.assertEqual([s.amount for s in inputs], [120, 50, 35])
+
+        inputs, available = wallet.tx_inputs(35, community, CoinSelection.EXACT_MATCH)
+        self.assertEqual([s.number for s in inputs], [6])
+
+        inputs, available = wallet.tx_inputs(25, community, CoinSelection.CONSOLIDATE)
+        self.assertEqual([s.amount for s in inputs], [10, 10, 10])
+        self.assertEqual(sum(s.amount for s in inputs + available), 245)
+
+        with self.assertRaises(NotEnoughMoneyError):
+            wallet.tx_inputs(300, community)
+
+    def test_reserved_sources(self):
+        wallet = Wallet(0, "7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ",
+                        "Wallet 1", self.identities_registry)
+        community = mock.Mock()
+        community.currency = "test_currency"
+        history = TxHistory(mock.Mock(), wallet)
+        wallet.caches["test_currency"] = history
+        history.available_sources = [InputSource(None, 'D', n, "HASH{0}".format(n), 100) for n in range(0, 3)]
+
+        first = mock.Mock()
+        first.state = TransferState.AWAITING
+        first_inputs, spendable = wallet.tx_inputs(150, community)
+        history.reserve_sources(first, first_inputs)
+        self.assertEqual(len(history.spendable_sources), 1)
+
+        # A second transfer in the same block spends another source
+        second = mock.Mock()
+        second.state = TransferState.AWAITING
+        second_inputs, spendable = wallet.tx_inputs(100, community)
+        self.assertNotIn(second_inputs[0], first_inputs)
+        history.reserve_sources(second, second_inputs)
+        with self.assertRaises(NotEnoughMoneyError):
+            wallet.tx_inputs(100, community)
+
+        # The sources of a refused transfer can be spent again
+        first.state = TransferState.REFUSED
+        self.assertEqual(len(history.spendable_sources), 2)
+        self.assertEqual(sum(s.amount for s in wallet.tx_inputs(200, community)[0]), 200)
+
+    def test_send_money_strategy(self):
+        wallet = Wallet(0, "7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ",
+                        "Wallet 1", self.identities_registry)
+        community = mock.Mock()
+        community.currency = "test_currency"
+        community.blockid = CoroutineMock(return_value=mock.Mock(number=15))
+        community.bma_access.future_request = CoroutineMock(return_value={'medianTime': 1441614759,
+                                                                                 'transactions': []})
+        wallet.caches["test_currency"] = TxHistory(mock.Mock(), wallet)
+        wallet._identities_registry = mock.Mock()
+        wallet._identities_registry.future_find = CoroutineMock(return_value=mock.Mock(uid="john"))
+        wallet.tx_inputs = mock.Mock(side_effect=NotEnoughMoneyError(0, "test_currency", 0, 100))
+
+        async def exec_test():
+            result = await wallet.send_money("salt", "password", community,
+                                             "HnFcSms8jzwngtVomTTnzudZx7SHUQY8sVE1y8yBmULk", 100, "",
+                                             CoinSelection.CONSOLIDATE)
+            self.assertFalse(result[0])
+            wallet.tx_inputs.assert_called_with(100, community, CoinSelection.CONSOLIDATE)
+
+        self.lp.run_until_complete(exec_test())
@@ -0,0 +1,51 @@
+import unittest
+import asyncio
+from PyQt5.QtCore import QLocale
+from sakia.core.txhistory import BlocksPrefetch
+from sakia.tests import QuamashTest
+
+
+class TestBlocksPrefetch(unittest.TestCase, QuamashTest):
+    def setUp(self):
+        self.setUpQuamash()
+        QLocale.setDefault(QLocale("en_GB"))
+
+    def tearDown(self):
+        self.tearDownQuamash()
+
+    def test_ordered_bounded_prefetch(self):
+        running = []
+        max_running = []
+
+        async def fetch(number):
+            running.append(number)
+            max_running.append(len(running))
+            # Later blocks answer first
+            await asyncio.sleep(0.01 * (10 - number % 10))
+            running.remove(number)
+            return "block {0}".format(number)
+
+        async def exec_test():
+            prefetch = BlocksPrefetch(fetch, range(0, 20), window=8, concurrency=4)
+            blocks = [await prefetch.next() for _ in range(0, 20)]
+            self.assertEqual(blocks, [(n, "block {0}".format(n)) for n in range(0, 20)])
+            self.assertLessEqual(max(max_running), 4)
+
+        self.lp.run_until_complete(exec_test())
+
+    def test_cancel(self):
+        fetched = []
+
+        async def fetch(number):
+            await asyncio.sleep(0.01)
+            fetched.append(number)
+            return number
+
+        async def exec_test():
+            prefetch = BlocksPrefetch(fetch, range(0, 20), window=4, concurrency=2)
+            await prefetch.next()
+            prefetch.cancel()
+            await asyncio.sleep(0.1)
+            self.assertLess(len(fetched), 6)
+
+        self.lp.run_until_complete(exec_test())
@@ -0,0 +1,83 @@
+import unittest
+from asynctest.mock import Mock
+from PyQt5.QtCore import QLocale
+from ucoinpy.api import bma
+from sakia.core.txhistory import TxHistory
+from sakia.core.scanner import BlockScanner
+from sakia.core.transfer import TransferState
+from sakia.tests import QuamashTest
+
+
+class TestTxHistoryDividends(unittest.TestCase, QuamashTest):
+    def setUp(self):
+        self.setUpQuamash()
+        QLocale.setDefault(QLocale("en_GB"))
+
+    def tearDown(self):
+        self.tearDownQuamash()
+
+    def test_incremental_dividends(self):
+        wallet = Mock()
+        wallet.pubkey = "7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ"
+        app = Mock()
+        app.block_scanner = Mock(return_value=BlockScanner())
+        history = TxHistory(app, wallet)
+        history.load_from_json({'latest_block': 20,
+                                'transfers': [],
+                                'sources': [],
+                                'member': True,
+                                'dividends': [{'block_number': 12, 'amount': 10, 'consumed': False,
+                                               'time': 0, 'id': 0, 'state': 'VALIDATING'}]})
+        requests = []
+        ud_blocks = [5, 12, 21]
+
+        async def future_request(request, req_args={}):
+            requests.append(request)
+            if request is bma.blockchain.UD:
+                return {'result': {'blocks': ud_blocks}}
+            elif request is bma.blockchain.Block:
+                return {'number': req_args['number'], 'dividend': 11, 'medianTime': 1441618206}
+            elif request is bma.ud.History:
+                return {'history': {'history': [{'block_number': 12, 'consumed': False,
+                                                 'time': 0, 'amount': 10}]}}
+
+        community = Mock()
+        community.bma_access.future_request = future_request
+        wallet._identities_registry.is_member = Mock(return_value=True)
+
+        async def exec_test():
+            dividends = await history.request_dividends(community, 10)
+            self.assertEqual([d['block_number'] for d in dividends], [12, 21])
+            self.assertEqual(dividends[0]['state'], TransferState.VALIDATING)
+            self.assertEqual(dividends[1]['amount'], 11)
+            self.assertNotIn(bma.ud.History, requests)
+
+            # Too many new dividends are requested in the dividends history
+            ud_blocks.extend([22, 23, 24])
+            requests.clear()
+            dividends = await history.request_dividends(community, 10)
+            self.assertIn(bma.ud.History, requests)
+            self.assertEqual([d['block_number'] for d in dividends], [12])
+
+            # The dividends history is requested when the membership changed
+            del ud_blocks[3:]
+            requests.clear()
+            wallet._identities_registry.is_member = Mock(return_value=False)
+            dividends = await history.request_dividends(community, 10)
+            self.assertIn(bma.ud.History, requests)
+            wallet._identities_registry.is_member.assert_called_with(wallet.pubkey, community)
+
+            # A wallet which is not a member does not receive the new dividends
+            requests.clear()
+            dividends = await history.request_dividends(community, 10)
+            self.assertNotIn(bma.ud.History, requests)
+            self.assertEqual([d['block_number'] for d in dividends], [12])
+
+            # The dividends history is requested while the members list is unknown
+            wallet._identities_registry.is_member = Mock(return_value=None)
+            requests.clear()
+            dividends = await history.request_dividends(community, 10)
+            self.assertIn(bma.ud.History, requests)
+            self.assertFalse(history._member)
+
+        self.lp.run_until_complete(exec_test())
@@ -0,0 +1,59 @@
+import unittest
+from unittest.mock import Mock
+from PyQt5.QtCore import QLocale
+from ucoinpy.documents import BlockId
+from sakia.core.txhistory import TxHistory
+from sakia.core.transfer import Transfer, TransferState
+from sakia.tests import QuamashTest
+
+
+class TestTxHistoryIndexes(unittest.TestCase, QuamashTest):
+    def setUp(self):
+        self.setUpQuamash()
+        QLocale.setDefault(QLocale("en_GB"))
+
+    def tearDown(self):
+        self.tearDownQuamash()
+
+    @staticmethod
+    def metadata():
+        return {'time': 0, 'comment': "", 'issuer': "A", 'issuer_uid': "",
+                'receiver': "B", 'receiver_uid': "", 'txid': 0, 'amount': 10}
+
+    def test_transfers_indexes(self):
+        history = TxHistory(Mock(), Mock())
+        blockid = BlockId(10, "7F4BC1D62C7F7D4B4E1DE0E1C4D1E5F9A3BFC7FA")
+        transfer = Transfer.create_from_blockchain("HASH1", blockid, self.metadata())
+        history.add_transfer(transfer)
+
+        self.assertEqual(history.transfer("HASH1"), transfer)
+        self.assertIsNone(history.transfer("HASH2"))
+        self.assertEqual(history._transfers_by_block[10], [transfer])
+
+        transfer.blockid = BlockId(12, "5E2ACD4AF3DB5A0D3A1E15F3A6BB8E7E5A8E1F7C")
+        self.assertNotIn(10, history._transfers_by_block)
+        self.assertEqual(history._transfers_by_block[12], [transfer])
+
+    def test_unhashed_transfer(self):
+        history = TxHistory(Mock(), Mock())
+        transfer = Transfer.initiate(self.metadata())
+        history.add_transfer(transfer)
+        self.assertIsNone(history.transfer("HASH1"))
+
+        # The hash is set when the transfer is sent
+        transfer.sha_hash = "HASH1"
+        self.assertEqual(history.transfer("HASH1"), transfer)
+
+    def test_load_and_save_dividends(self):
+        history = TxHistory(Mock(), Mock())
+        history.load_from_json({'latest_block': 20,
+                                'transfers': [],
+                                'sources': [],
+                                'dividends': [{'block_number': 5, 'amount': 10, 'consumed': False,
+                                               'time': 0, 'id': 0, 'state': 'VALIDATED'}]})
+        self.assertEqual(history._dividends_by_block[5]['state'], TransferState.VALIDATED)
+
+        data = history.jsonify()
+        self.assertEqual(data['dividends'][0]['state'], 'VALIDATED')
+        # Saving the history does not modify the dividends
+        self.assertEqual(history.dividends[0]['state'], TransferState.VALIDATED)
@@ -0,0 +1,67 @@
+import unittest
+from unittest.mock import Mock
+from PyQt5.QtCore import QLocale
+from sakia.core.txhistory import TxHistory
+from sakia.tests import QuamashTest
+
+
+class TestTxHistoryRollback(unittest.TestCase, QuamashTest):
+    def setUp(self):
+        self.setUpQuamash()
+        QLocale.setDefault(QLocale("en_GB"))
+
+    def tearDown(self):
+        self.tearDownQuamash()
+
+    def test_fork_point(self):
+        history = TxHistory(Mock(), Mock())
+        known_blocks = [(n, "HASH{0}".format(n)) for n in range(100, 164)]
+        fetched = []
+
+        async def get_block_doc(community, number):
+            fetched.append(number)
+            block_doc = Mock()
+            # The blocks from 137 were rolled back
+            block_doc.blockid.sha_hash = "HASH{0}".format(number) if number < 137 else "FORK{0}".format(number)
+            return block_doc
+
+        history._get_block_doc = get_block_doc
+
+        async def exec_test():
+            fork_index = await history._fork_point(Mock(), known_blocks)
+            self.assertEqual(known_blocks[fork_index][0], 137)
+            self.assertLessEqual(len(fetched), 7)
+
+            fetched.clear()
+            fork_index = await history._fork_point(Mock(), known_blocks[:30])
+            self.assertEqual(fork_index, 30)
+            self.assertLessEqual(len(fetched), 5)
+
+        self.lp.run_until_complete(exec_test())
+
+    def test_rollback_parsed_blocks(self):
+        app = Mock()
+        history = TxHistory(app, Mock())
+        history.latest_block = 150
+        history._parsed_blocks = dict((n, "HASH{0}".format(n)) for n in range(120, 151))
+        community = Mock()
+        community.network.current_blockid.number = 152
+        community.network.fork_window = 100
+
+        async def get_block_doc(community, number):
+            block_doc = Mock()
+            # The blocks from 140 were rolled back
+            block_doc.blockid.sha_hash = "HASH{0}".format(number) if number < 140 else "FORK{0}".format(number)
+            return block_doc
+
+        history._get_block_doc = get_block_doc
+
+        async def exec_test():
+            await history._rollback(community)
+            self.assertEqual(history.latest_block, 140)
+            self.assertEqual(sorted(history._parsed_blocks), list(range(120, 140)))
+            self.assertIsNone(history._sources_reconciliation)
+            # The blocks scanned for other wallets are not compared
+            app.block_scanner.assert_not_called()
+
+        self.lp.run_until_complete(exec_test())
@@ -0,0 +1,101 @@
+import unittest
+from asynctest.mock import Mock, CoroutineMock
+from PyQt5.QtCore import QLocale
+from ucoinpy.documents.transaction import InputSource, OutputSource
+from sakia.core.txhistory import TxHistory
+from sakia.core.transfer import Transfer, TransferState
+from sakia.tools.exceptions import NoPeerAvailable
+from sakia.tests import QuamashTest
+
+
+class TestTxHistorySources(unittest.TestCase, QuamashTest):
+    def setUp(self):
+        self.setUpQuamash()
+        QLocale.setDefault(QLocale("en_GB"))
+
+    def tearDown(self):
+        self.tearDownQuamash()
+
+    def test_apply_blocks(self):
+        wallet = Mock()
+        wallet.pubkey = "7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ"
+        history = TxHistory(Mock(), wallet)
+        history.load_from_json({'latest_block': 20,
+                                'transfers': [],
+                                'sources': [{'inline': "0:D:5:00003BDA844D77EEE7CF32A6C3C87F2ACBFCFCBB:100\n"},
+                                            {'inline': "0:D:8:0000CB4E9CCDE6F579135331C97F13903E8B6E21:100\n"}],
+                                'sources_block': 20,
+                                'dividends': []})
+        self.assertTrue(history.sources_synced)
+
+        tx = Mock()
+        tx.issuers = [wallet.pubkey]
+        tx.inputs = [InputSource(0, 'D', 5, "00003BDA844D77EEE7CF32A6C3C87F2ACBFCFCBB", 100)]
+        tx.outputs = [OutputSource("HnFcSms8jzwngtVomTTnzudZx7SHUQY8sVE1y8yBmULk", 60),
+                      OutputSource(wallet.pubkey, 40)]
+        tx.sha_hash = "A3BA5D1B2C0BB24B0AE7A84A5D4B8A3C2E8F7D6C"
+
+        # The transactions of the blocks already applied are ignored
+        history._apply_transaction(tx, 20)
+        self.assertEqual(sum(s.amount for s in history.available_sources), 200)
+
+        history._apply_transaction(tx, 21)
+        history._apply_dividend(21, "00004A1C6D8CDE6F579135331C97F13903E8B6E2", 110)
+        self.assertEqual(sorted((s.source, s.number, s.amount) for s in history.available_sources),
+                         [('D', 8, 100), ('D', 21, 110), ('T', 21, 40)])
+        # The sources stay sorted by amount for the coin selection
+        self.assertEqual([s.amount for s in history.available_sources], [40, 100, 110])
+        self.assertEqual(history.jsonify()['sources_block'], 20)
+
+    def test_reconcile_sources(self):
+        wallet = Mock()
+        wallet.pubkey = "7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ"
+        history = TxHistory(Mock(), wallet)
+        history.load_from_json({'latest_block': 20,
+                                'transfers': [],
+                                'sources': [{'inline': "0:D:5:00003BDA844D77EEE7CF32A6C3C87F2ACBFCFCBB:100\n"}],
+                                'sources_block': 20,
+                                'dividends': []})
+        community = Mock()
+
+        async def exec_test():
+            # The sources are kept when the network can not be reached
+            wallet.request_sources = CoroutineMock(side_effect=NoPeerAvailable("test_currency", 0))
+            await history._reconcile_sources(community, 25)
+            self.assertEqual([s.number for s in history.available_sources], [5])
+            self.assertEqual(history.jsonify()['sources_block'], 20)
+            self.assertIsNone(history._sources_reconciliation)
+
+            wallet.request_sources = CoroutineMock(
+                return_value=[InputSource(0, 'D', 8, "0000CB4E9CCDE6F579135331C97F13903E8B6E21", 100)])
+            await history._reconcile_sources(community, 25)
+            self.assertEqual([s.number for s in history.available_sources], [8])
+            self.assertEqual(history.jsonify()['sources_block'], 25)
+            self.assertEqual(history._sources_reconciliation, 25)
+
+        self.lp.run_until_complete(exec_test())
+
+    def test_load_and_save_reservations(self):
+        wallet = Mock()
+        wallet.pubkey = "7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ"
+        history = TxHistory(Mock(), wallet)
+        history.available_sources = [InputSource(0, 'D', n, "0000CB4E9CCDE6F579135331C97F13903E8B6E21", 100)
+                                     for n in range(0, 3)]
+        metadata = {'time': 0, 'comment': "", 'issuer': wallet.pubkey, 'issuer_uid': "",
+                    'receiver': "B", 'receiver_uid': "", 'txid': 0, 'amount': 100}
+        refused = Transfer.initiate(dict(metadata))
+        refused.state = TransferState.REFUSED
+        awaiting = Transfer.initiate(dict(metadata))
+        awaiting.state = TransferState.AWAITING
+        history.add_transfer(refused)
+        history.add_transfer(awaiting)
+        history.reserve_sources(refused, history.available_sources[0:1])
+        history.reserve_sources(awaiting, history.available_sources[1:2])
+
+        # The sources reserved by a transfer stay reserved when the history is loaded again
+        history_from_json = TxHistory(Mock(), wallet)
+        history_from_json.load_from_json(history.jsonify())
+        self.assertEqual([s.number for s in history_from_json.spendable_sources], [0, 2])
+
+        history_from_json.transfers[1].state = TransferState.REFUSED
+        self.assertEqual(len(history_from_json.spendable_sources), 3)
@@ -0,0 +1,38 @@
+import unittest
+from ucoinpy.documents import Block
+from ucoinpy.documents.peer import Peer
+from sakia.tools.documents import DocumentsCache
+from sakia.tests.mocks.bma import nice_blockchain
+
+peer_raw = """Version: 1
+Type: Peer
+Currency: meta_brouzouf
+PublicKey: 8Fi1VSTbjkXguwThF4v2ZxC5whK7pwG2vcGTkPUPjPGU
+Block: 48698-000005E0F228038E4DDD4F6CA4ACB01EC88FBAF8
+Endpoints:
+BASIC_MERKLED_API ucoin.inso.ovh 80
+82o1sNCh1bLpUXU6nacbK48HBcA9Eu2sPkL1/3c2GtDPxBUZd2U2sb7DxwJ54n6ce9G0Oy7nd1hCxN3fS0oADw==
+"""
+
+
+class TestDocumentsCache(unittest.TestCase):
+    def test_parse_once(self):
+        cache = DocumentsCache()
+        block = nice_blockchain.bma_blockchain_current
+        signed_raw = "{0}{1}\n".format(block['raw'], block['signature'])
+        block_doc = cache.parse(Block, signed_raw)
+        self.assertEqual(block_doc.number, 30898)
+        self.assertIs(cache.parse(Block, signed_raw), block_doc)
+        peer_doc = cache.parse(Peer, peer_raw)
+        self.assertEqual(peer_doc.pubkey, "8Fi1VSTbjkXguwThF4v2ZxC5whK7pwG2vcGTkPUPjPGU")
+        self.assertIs(cache.parse(Peer, peer_raw), peer_doc)
+        self.assertEqual(len(cache), 2)
+
+    def test_bounded(self):
+        cache = DocumentsCache(max_documents=1)
+        block = nice_blockchain.bma_blockchain_current
+        signed_raw = "{0}{1}\n".format(block['raw'], block['signature'])
+        block_doc = cache.parse(Block, signed_raw)
+        cache.parse(Peer, peer_raw)
+        self.assertEqual(len(cache), 1)
+        self.assertIsNot(cache.parse(Block, signed_raw), block_doc)
@@ -0,0 +1,64 @@
+import hashlib
+from collections import OrderedDict
+from ucoinpy.documents import Block
+from ucoinpy.documents.peer import Peer
+
+MAX_DOCUMENTS = 1024
+
+
+class DocumentsCache:
+    """
+    A cache of the parsed signed documents, keyed by the hash of their raw text.
+    The least recently used documents are forgotten first.
+
+    .. warning:: The documents are shared by all the callers and must not be modified.
+    """
+    def __init__(self, max_documents=MAX_DOCUMENTS):
+        """
+        :param int max_documents: The maximum number of documents kept
+        """
+        self._max_documents = max_documents
+        self._documents = OrderedDict()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def parse(self, document_cls, signed_raw):
+        """
+        Parse a signed document, once for each signed raw text
+
+        :param class document_cls: The ucoinpy document class
+        :param str signed_raw: The signed raw document
+        :return: The parsed document
+        """
+        key = (document_cls, hashlib.sha1(signed_raw.encode('utf-8')).digest())
+        document = self._documents.get(key)
+        if document is not None:
+            self._documents.move_to_end(key)
+            return document
+
+        document = document_cls.from_signed_raw(signed_raw)
+        self._documents[key] = document
+        while len(self._documents) > self._max_documents:
+            self._documents.popitem(last=False)
+        return document
+
+
+# The documents parsed by the whole application
+documents_cache = DocumentsCache()
+
+
+def parse_block(signed_raw):
+    """
+    :param str signed_raw: The signed raw block
+    :rtype: ucoinpy.documents.Block
+    """
+    return documents_cache.parse(Block, signed_raw)
+
+
+def parse_peer(signed_raw):
+    """
+    :param str signed_raw: The signed raw peer document
+    :rtype: ucoinpy.documents.peer.Peer
+    """
+    return documents_cache.parse(Peer, signed_raw)